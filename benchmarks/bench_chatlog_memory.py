@@ -0,0 +1,96 @@
+"""Memory benchmark for the chat log cache.
+
+Builds a channel log of logged messages the way ChatLogCache does when it replays
+segments, once with the plain message data dicts and once packed into tuples by
+pack_message, and compares the memory each one holds and how long it takes to load
+and to garbage collect. Run from the repository root:
+
+    python benchmarks/bench_chatlog_memory.py [--count 1000000]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "data"))
+
+from utils.chatlog import ChatLogStore
+
+WORDS = ("the a stream tonight game queue chat lol gg mods raid link discord server play "
+         "sub emote clip vod schedule thanks everyone hype boss level run death").split()
+
+GUILD_ID = "123456789012345678"
+
+def make_lines(rng, count, authors=2000, channels=40):
+    """Serialized put records like the ones in the segment files"""
+    author_ids = [str(rng.randrange(10 ** 17, 10 ** 18)) for _ in range(authors)]
+    channel_ids = [str(rng.randrange(10 ** 17, 10 ** 18)) for _ in range(channels)]
+    message_id = 1200000000000000000
+    lines = []
+    for _ in range(count):
+        message_id += rng.randrange(1, 1 << 24)
+        author = rng.randrange(authors)
+        channel = rng.randrange(channels)
+        data = {
+            "author_id": author_ids[author],
+            "author_name": f"user_{author}",
+            "channel_id": channel_ids[channel],
+            "channel_name": f"channel-{channel}",
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randrange(1, 12))),
+            "created_at": "2025-01-01 12:00:00",
+            "jump_url": f"https://discord.com/channels/{GUILD_ID}/{channel_ids[channel]}/{message_id}"
+        }
+        lines.append(json.dumps({"op": "put", "id": str(message_id), "data": data}, separators=(',', ':')))
+    return lines
+
+def build_log(lines, packed):
+    store = ChatLogStore.__new__(ChatLogStore)  # apply_record needs no files
+    message_log = {}
+    for line in lines:
+        store.apply_record(message_log, json.loads(line), packed)
+    return message_log
+
+def measure(lines, packed):
+    # Timed without tracemalloc, which slows allocation down a lot
+    gc.collect()
+    started = time.perf_counter()
+    message_log = build_log(lines, packed)
+    elapsed = time.perf_counter() - started
+
+    # A full collection has to walk every object the cache keeps tracked
+    gc.collect()
+    started = time.perf_counter()
+    gc.collect()
+    gc_elapsed = time.perf_counter() - started
+    del message_log
+    gc.collect()
+
+    tracemalloc.start()
+    message_log = build_log(lines, packed)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del message_log
+    gc.collect()
+    return used, elapsed, gc_elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    lines = make_lines(random.Random(1234), args.count)
+
+    print(f"{'layout':14} {'MiB':>10} {'bytes/msg':>10} {'load s':>8} {'gc ms':>8}")
+    results = {}
+    for name, packed in (("dict", False), ("packed tuple", True)):
+        used, elapsed, gc_elapsed = measure(lines, packed)
+        results[name] = used
+        print(f"{name:14} {used / 2 ** 20:10.1f} {used / args.count:10.0f} {elapsed:8.2f} {gc_elapsed * 1000:8.1f}")
+    print(f"Packed tuples use {results['packed tuple'] / results['dict']:.0%} of the dict layout's memory")
+
+if __name__ == "__main__":
+    main()
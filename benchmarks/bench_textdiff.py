@@ -0,0 +1,95 @@
+"""Micro-benchmark for the edit log diff.
+
+Compares the old character-level SequenceMatcher diff with utils.textdiff on
+realistic message edit pairs. Run from the repository root:
+
+    python benchmarks/bench_textdiff.py
+"""
+import difflib
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "data"))
+
+from utils.textdiff import ANSI_DELETED, ANSI_INSERTED, diff_segments, format_ansi_fields
+
+WORDS = ("the a stream tonight game queue chat lol gg mods raid link discord server play "
+         "sub emote clip vod schedule thanks everyone hype boss level run death").split()
+
+def random_text(rng, length):
+    words = []
+    total = 0
+    while total < length:
+        word = rng.choice(WORDS)
+        if rng.random() < 0.1:
+            word += rng.choice(".,!?")
+        words.append(word)
+        total += len(word) + 1
+    return " ".join(words)[:length]
+
+def edit_text(rng, text, edits):
+    words = text.split(" ")
+    for _ in range(edits):
+        index = rng.randrange(len(words))
+        action = rng.random()
+        if action < 0.4:
+            words[index] = rng.choice(WORDS)
+        elif action < 0.7:
+            words.insert(index, rng.choice(WORDS))
+        elif len(words) > 1:
+            del words[index]
+    return " ".join(words)
+
+def old_char_diff(original_content, edited_content):
+    """The character-level diff the edit logger used before utils.textdiff"""
+    original_words = list(original_content)
+    edited_words = list(edited_content)
+    highlighted_original = ""
+    highlighted_edited = ""
+    matcher = difflib.SequenceMatcher(None, original_words, edited_words)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            highlighted_original += "".join(original_words[i1:i2])
+            highlighted_edited += "".join(edited_words[j1:j2])
+        elif tag == 'delete':
+            highlighted_original += f"{ANSI_DELETED}{''.join(original_words[i1:i2])}"
+        elif tag == 'insert':
+            highlighted_edited += f"{ANSI_INSERTED}{''.join(edited_words[j1:j2])}"
+        elif tag == 'replace':
+            highlighted_original += f"{ANSI_DELETED}{''.join(original_words[i1:i2])}"
+            highlighted_edited += f"{ANSI_INSERTED}{''.join(edited_words[j1:j2])}"
+    return highlighted_original, highlighted_edited
+
+def new_word_diff(original_content, edited_content):
+    before_segments, after_segments = diff_segments(original_content, edited_content)
+    return format_ansi_fields(before_segments, ANSI_DELETED), format_ansi_fields(after_segments, ANSI_INSERTED)
+
+def main():
+    rng = random.Random(1234)
+    cases = [
+        ("typo fix, 80 chars", 80, 1),
+        ("few edits, 400 chars", 400, 3),
+        ("few edits, 2000 chars", 2000, 3),
+        ("many edits, 2000 chars", 2000, 40),
+        ("few edits, 4000 chars (Nitro)", 4000, 3),
+        ("many edits, 4000 chars (Nitro)", 4000, 80),
+        ("full rewrite, 4000 chars (Nitro)", 4000, None),
+    ]
+
+    print(f"{'case':34} {'old ms':>10} {'new ms':>10} {'speedup':>9} {'fields':>7}")
+    for name, length, edits in cases:
+        original = random_text(rng, length)
+        edited = edit_text(rng, original, edits) if edits is not None else random_text(rng, length)
+
+        runs = 5
+        old_time = timeit.timeit(lambda: old_char_diff(original, edited), number=runs) / runs * 1000
+        new_time = timeit.timeit(lambda: new_word_diff(original, edited), number=runs) / runs * 1000
+        before_fields, after_fields = new_word_diff(original, edited)
+        assert all(len(field) <= 1024 for field in before_fields + after_fields)
+
+        print(f"{name:34} {old_time:10.2f} {new_time:10.2f} {old_time / new_time:8.1f}x {len(before_fields) + len(after_fields):7}")
+
+if __name__ == "__main__":
+    main()
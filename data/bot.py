@@ -1,8 +1,13 @@
 import discord
 from discord.ext import commands
 import json
+import os
 from datetime import datetime
 import pytz
+from utils.archive import MessageArchive
+from utils.chatlog import ChatLogCache, ChatLogStore
+from utils.logsender import LogSender
+from utils.queueengine import QueueEngine
 
 intents = discord.Intents.all()
 
@@ -13,6 +18,17 @@ with open('secrets.json') as config_file:
 bot = commands.Bot(command_prefix='$', intents=intents)
 timezone = pytz.timezone(config["TIMEZONE"])
 
+# Message log cache and indexed archive shared by the moderation cogs
+chat_log_store = ChatLogStore("chat_logs")
+bot.message_archive = MessageArchive(os.path.join(chat_log_store.root_dir, "message_archive.db"))
+bot.chat_logs = ChatLogCache(chat_log_store, archive=bot.message_archive)
+
+# Batched sender for the moderation log channels
+bot.log_sender = LogSender(bot, flush_interval=float(config.get("LOG_FLUSH_SECONDS", 2)), max_queue=int(config.get("LOG_MAX_QUEUE", 250)))
+
+# Game queue shared by the queue and queue master cogs
+bot.queue_engine = QueueEngine("queue_files")
+
 async def load_extensions():
     for filename in ['d20', 'general', 'moderationcommands', 'moderationevents', 'stream', 'queue', 'queuemaster']:
         await bot.load_extension(f"cogs.{filename}")
@@ -25,51 +41,17 @@ async def on_ready():
 
     moderation_cog = bot.get_cog('ModerationCommands')
     if moderation_cog:
-        await startup_logger(moderation_cog)
-
-# Copy of logger commmand to run on every startup
-async def startup_logger(moderation_cog):
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Running startup message logging...")
-
-    for guild in moderation_cog.bot.guilds:
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Processing messages for guild {guild.name}")
-        total_messages_logged = 0
-
-        for channel in guild.text_channels:
-            channel_id = str(channel.id)
-            message_log = moderation_cog.load_message_log(channel_id)
-            channel_messages_logged = 0
-
-            try:
-                async for message in channel.history(limit=None, oldest_first=True):
-                    if message.author.bot:
-                        continue
+        startup_logger(moderation_cog)
 
-                    created_at_tz = message.created_at.astimezone(timezone)
-
-                    message_data = {
-                        "author_id": str(message.author.id),
-                        "author_name": message.author.name,
-                        "channel_id": channel_id,
-                        "channel_name": channel.name,
-                        "content": message.content,
-                        "created_at": created_at_tz.strftime('%Y-%m-%d %H:%M:%S'),
-                        "jump_url": message.jump_url
-                    }
-
-                    if str(message.id) not in message_log:
-                        message_log[str(message.id)] = message_data
-                        total_messages_logged += 1
-                        channel_messages_logged += 1
-
-                moderation_cog.save_message_log(channel_id, message_log)
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Logged {channel_messages_logged} messages for channel {channel.name}")
-
-            except Exception as e:
-                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error processing channel {channel.name}: {e}")
-
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Completed logging for guild {guild.name}. Total messages logged: {total_messages_logged}")
+# Catch up on messages sent since the last run in the background, using the same backfill as the logger command
+def startup_logger(moderation_cog):
+    channels = [channel for guild in moderation_cog.bot.guilds for channel in guild.text_channels]
+    if moderation_cog.start_backfill(channels):
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Running startup message logging for {len(channels)} channels...")
 
 bot.run(config.get("CLIENT_TOKEN"))
+
+# Write anything still waiting in the chat log cache and archive before exiting
+bot.chat_logs.flush()
+bot.message_archive.close()
+bot.queue_engine.close()
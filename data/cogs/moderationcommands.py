@@ -1,43 +1,53 @@
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 import discord
 from discord.ext import commands
 import json
+import math
 import os
 import pytz
+import re
+import shlex
+import time
+from typing import Optional
+from utils.backfill import BackfillJob
+from utils.export import EXPORT_FORMATS, export_messages, parse_date_bound
 
 class ModerationCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         with open('secrets.json') as config_file:
             self.config = json.load(config_file)
-        self.chat_logs_dir = "chat_logs"
-        if not os.path.exists(self.chat_logs_dir):
-            os.makedirs(self.chat_logs_dir)
+        self.chat_logs = bot.chat_logs
+        self.message_archive = bot.message_archive
         self.timezone = pytz.timezone(self.config["TIMEZONE"])
+        self.backfill_concurrency = int(self.config.get("BACKFILL_CONCURRENCY", 4))
+        self.backfill_job = None
+        self.export_dir = "exports"
 
-    def get_message_log_file(self, channel_id):
-        return os.path.join(self.chat_logs_dir, f"message_log_{channel_id}.json")
+    async def load_message_log(self, channel_id):
+        return await self.chat_logs.get_log(channel_id)
 
-    def load_message_log(self, channel_id):
-        file_path = self.get_message_log_file(channel_id)
-        try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-
-    def save_message_log(self, channel_id, message_log):
-        file_path = self.get_message_log_file(channel_id)
-        with open(file_path, 'w') as f:
-            json.dump(message_log, f, indent=4)
+    async def save_new_messages(self, channel_id, new_messages):
+        """Add newly backfilled messages to the channel's log"""
+        self.chat_logs.log_messages(channel_id, new_messages)
+        await self.chat_logs.flush_if_needed()
 
     @commands.command(hidden=True)
     @commands.has_permissions(administrator=True)
-    async def purgeafter(self, ctx, *, timestamp: str):
+    async def purgeafter(self, ctx, *, options: str):
         """Deletes all messages after the specified date and time.
 
         Format the timestamp as 'YYYY-MM-DD HH:MM:SS'. Example: '2023-10-01 12:00:00'
+        Optionally follow it with `user:@member` to only delete one user's messages, `contains:"some text"` to only
+        delete messages containing that text, and `dryrun` to count what would be deleted without deleting anything.
         """
+        timestamp, _, filters = options.strip().partition(" ")
+        filters = filters.strip()
+        if re.match(r"\d{2}:\d{2}:\d{2}", filters):
+            time_part, _, filters = filters.partition(" ")
+            timestamp = f"{timestamp} {time_part}"
+
         try:
             # Convert the timestamp string to a datetime object
             after_time = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
@@ -46,38 +56,225 @@ class ModerationCommands(commands.Cog):
             await ctx.send("Invalid timestamp format. Please use 'YYYY-MM-DD HH:MM:SS'.")
             return
 
+        try:
+            user_id, contains, dry_run = self.parse_purge_filters(filters)
+        except ValueError as e:
+            await ctx.send(str(e))
+            return
+
+        def matches(message):
+            if user_id is not None and message.author.id != user_id:
+                return False
+            if contains is not None and contains not in message.content.lower():
+                return False
+            return True
+
         # Get the channel where the command was invoked
         channel = ctx.channel
 
-        # Delete messages after the specified time
-        deleted_count = 0
-        async for message in channel.history(after=after_time, oldest_first=True):
-            await message.delete()
-            deleted_count += 1
+        # Discord only bulk deletes messages younger than 14 days, leave a margin for how long the purge takes
+        bulk_cutoff = discord.utils.utcnow() - timedelta(days=14) + timedelta(hours=1)
+
+        progress_message = await ctx.send(f"{'Counting' if dry_run else 'Deleting'} messages after {after_time}...")
+        skip_ids = {progress_message.id, ctx.message.id} if dry_run else {progress_message.id}
+
+        bulk_count = 0
+        single_count = 0
+        failed_count = 0
+        last_progress = time.monotonic()
+        batch = []
+
+        async def update_progress(final=False, error=None):
+            nonlocal last_progress
+            if not final and time.monotonic() - last_progress < 5:
+                return
+            last_progress = time.monotonic()
+            verb = "Would delete" if dry_run else ("Deleted" if final else "Deleting...")
+            text = f"{verb} {bulk_count + single_count} messages after {after_time} ({bulk_count} in bulk, {single_count} one at a time)."
+            if failed_count:
+                text += f" {failed_count} couldn't be deleted."
+            if error:
+                text += f" Stopped early after an error: {error}"
+            try:
+                await progress_message.edit(content=text)
+            except discord.HTTPException:
+                pass
+
+        async def delete_single(message):
+            nonlocal single_count, failed_count
+            try:
+                await message.delete()
+                single_count += 1
+            except discord.NotFound:
+                pass  # Already gone
+            except discord.HTTPException as e:
+                failed_count += 1
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationcommands.py) Error deleting message {message.id}: {e}")
+            await asyncio.sleep(1)  # Single deletes share a tight rate limit, pace them
+
+        async def delete_batch(messages):
+            nonlocal bulk_count
+            if dry_run:
+                bulk_count += len(messages)
+                return
+            try:
+                await channel.delete_messages(messages)
+                bulk_count += len(messages)
+            except discord.HTTPException as e:
+                # Like a message crossing the 14 day line mid-purge, fall back to deleting the batch one at a time
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationcommands.py) Bulk delete of {len(messages)} messages failed, deleting them one at a time: {e}")
+                for message in messages:
+                    await delete_single(message)
+
+        error = None
+        try:
+            # Delete messages after the specified time, oldest first so anything too old for bulk delete comes before the rest
+            async for message in channel.history(limit=None, after=after_time, oldest_first=True):
+                if message.id in skip_ids or not matches(message):
+                    continue
+
+                if message.created_at < bulk_cutoff:
+                    if dry_run:
+                        single_count += 1
+                    else:
+                        await delete_single(message)
+                else:
+                    batch.append(message)
+                    if len(batch) == 100:
+                        await delete_batch(batch)
+                        batch = []
+                await update_progress()
+
+            if batch:
+                await delete_batch(batch)
+        except discord.HTTPException as e:
+            error = e
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationcommands.py) Error in purgeafter: {e}")
+        finally:
+            await update_progress(final=True, error=error)
+
+    def parse_purge_filters(self, filters):
+        """Parse purgeafter's optional `user:`, `contains:` and `dryrun` filters"""
+        user_id = None
+        contains = None
+        dry_run = False
+        try:
+            tokens = shlex.split(filters)
+        except ValueError:
+            raise ValueError("Couldn't read the filters, check that quotes are closed.")
 
-        await ctx.send(f"Deleted {deleted_count} messages after {after_time}.")
+        for token in tokens:
+            name, _, value = token.partition(":")
+            name = name.lower()
+            if name == "dryrun" and not value:
+                dry_run = True
+            elif name == "user" and value:
+                user_match = re.fullmatch(r"<@!?(\d+)>|(\d+)", value)
+                if not user_match:
+                    raise ValueError(f"Invalid user `{value}`. Use a mention or a user ID.")
+                user_id = int(user_match.group(1) or user_match.group(2))
+            elif name == "contains" and value:
+                contains = value.lower()
+            else:
+                raise ValueError(f"Unknown filter `{token}`. Use `user:@member`, `contains:\"text\"` or `dryrun`.")
+        return user_id, contains, dry_run
 
     @commands.hybrid_command(hidden=True)
     @commands.has_permissions(administrator=True)
-    async def logeverymessage(self, ctx):
-        """Logs the entire message history for every channel in the guild."""
+    async def logeverymessage(self, ctx, full: bool = False):
+        """Logs the message history for every channel in the guild in the background.
+
+        Only messages newer than what is already logged are fetched. Pass `full` to re-crawl every channel from the beginning.
+        """
+        if self.start_backfill(ctx.guild.text_channels, full):
+            response = f"Started logging {len(ctx.guild.text_channels)} channels. Use `$backfillstatus` to check progress."
+        else:
+            response = f"A backfill is already running. {self.backfill_job.progress_text()}"
+
         if isinstance(ctx.interaction, discord.Interaction):
-            await ctx.defer(ephemeral=True)
+            await ctx.reply(response, ephemeral=True)
+        else:
+            await ctx.reply(response)
 
-        guild = ctx.guild
-        total_messages_logged = 0
+    @commands.hybrid_command(hidden=True)
+    @commands.has_permissions(administrator=True)
+    async def backfillstatus(self, ctx):
+        """Shows the progress of the current or last message history backfill."""
+        response = self.backfill_job.progress_text() if self.backfill_job else "No backfill has been run."
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.reply(response, ephemeral=True)
+        else:
+            await ctx.reply(response)
 
-        for channel in guild.text_channels:
-            channel_id = str(channel.id)
-            message_log = self.load_message_log(channel_id)
-            async for message in channel.history(limit=None, oldest_first=True):
-                if message.author.bot:
-                    continue  # Ignore messages from bots
+    @commands.hybrid_command(hidden=True)
+    @commands.has_permissions(administrator=True)
+    async def logqueue(self, ctx):
+        """Shows how far behind the log channels are."""
+        response = self.bot.log_sender.status_text()
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.reply(response, ephemeral=True)
+        else:
+            await ctx.reply(response)
 
+    @commands.hybrid_command(hidden=True)
+    @commands.has_permissions(administrator=True)
+    async def cancelbackfill(self, ctx):
+        """Cancels the running message history backfill."""
+        if self.backfill_job and self.backfill_job.is_running():
+            self.backfill_job.cancel()
+            response = "Backfill cancelled. It will resume from where it stopped next time."
+        else:
+            response = "No backfill is running."
+
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.reply(response, ephemeral=True)
+        else:
+            await ctx.reply(response)
+
+    def start_backfill(self, channels, full=False):
+        """Start a background backfill of the given channels, returns None if one is already running"""
+        if self.backfill_job and self.backfill_job.is_running():
+            return None
+
+        self.backfill_job = BackfillJob(channels, self.backfill_channel, full=full, concurrency=self.backfill_concurrency)
+        self.backfill_job.start()
+        return self.backfill_job
+
+    async def backfill_channel(self, channel, full=False, on_progress=None, batch_size=500):
+        """Log the channel's history that isn't in the log yet and return how many messages were logged.
+
+        Only messages after the channel's high-water mark are fetched unless `full` is set.
+        Messages are written every `batch_size` fetched messages.
+        """
+        channel_id = str(channel.id)
+        after, before = await self.chat_logs.get_backfill_range(channel_id, full)
+
+        # A full crawl has to skip what is already logged, compacted months included, an incremental one starts past it
+        message_log = await self.load_message_log(channel_id) if full else {}
+        archived_month = None
+        archived_ids = set()
+
+        new_messages = {}
+        messages_logged = 0
+        batch_fetched = 0
+        last_message_id = None
+        async for message in channel.history(
+            limit=None,
+            after=discord.Object(id=after) if after else None,
+            before=discord.Object(id=before) if before else None,
+            oldest_first=True
+        ):
+            if full and message.created_at.strftime('%Y-%m') != archived_month:
+                # History comes oldest first, so each month's archive is only read once
+                archived_month = message.created_at.strftime('%Y-%m')
+                archived_ids = await self.chat_logs.get_archived_ids(channel_id, archived_month)
+
+            # Ignore messages from bots and anything already logged
+            if not message.author.bot and str(message.id) not in message_log and str(message.id) not in archived_ids:
                 # Convert the message's created_at timestamp to the specified timezone
                 created_at_tz = message.created_at.astimezone(self.timezone)
 
-                message_data = {
+                new_messages[str(message.id)] = {
                     "author_id": str(message.author.id),
                     "author_name": message.author.name,
                     "channel_id": channel_id,
@@ -87,17 +284,236 @@ class ModerationCommands(commands.Cog):
                     "jump_url": message.jump_url
                 }
 
-                if str(message.id) not in message_log:
-                    message_log[str(message.id)] = message_data
-                    total_messages_logged += 1
+            last_message_id = message.id
+            batch_fetched += 1
+            if batch_fetched >= batch_size:
+                messages_logged += await self.save_backfill_batch(channel_id, new_messages, last_message_id)
+                new_messages = {}
+                if on_progress:
+                    on_progress(batch_fetched)
+                batch_fetched = 0
+
+        messages_logged += await self.save_backfill_batch(channel_id, new_messages, None)
+        if on_progress:
+            on_progress(batch_fetched)
+        self.chat_logs.complete_backfill(channel_id, last_message_id)
+        return messages_logged
+
+    async def save_backfill_batch(self, channel_id, new_messages, resume_after_id):
+        await self.save_new_messages(channel_id, new_messages)
+        if resume_after_id:
+            self.chat_logs.advance_backfill(channel_id, resume_after_id)
+        return len(new_messages)
+
+    @commands.hybrid_command(hidden=True)
+    @commands.has_permissions(administrator=True)
+    async def migratelogs(self, ctx):
+        """Imports every existing chat log, compacted archives included, into the indexed message archive."""
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.defer(ephemeral=True)
+
+        # Make sure the segment store has everything before reading it back
+        await self.chat_logs.flush_async()
+
+        store = self.chat_logs.store
+        total_messages = 0
+        for channel_id in sorted(store.channel_ids()):
+            # Compacted months first, so a message brought back into the hot log by an edit ends up with its newer version
+            for path in store.list_archives(channel_id).values():
+                archived_log = await asyncio.to_thread(store.load_archive, path)
+                self.message_archive.ingest_channel(channel_id, archived_log)
+                total_messages += len(archived_log)
+
+            tombstones = set()
+            message_log = await asyncio.to_thread(store.load_channel, channel_id, False, tombstones)
+            self.message_archive.ingest_channel(channel_id, message_log)
+            total_messages += len(message_log)
+
+            # Messages deleted since the last compaction, which an archive may still hold
+            self.message_archive.write_records(channel_id, [{"op": "delete", "id": message_id} for message_id in tombstones])
+
+        response = f"Queued {total_messages} messages from {len(store.channel_ids())} channel logs for the message archive."
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.reply(response, ephemeral=True)
+        else:
+            await ctx.reply(response)
+
+    @commands.hybrid_command(hidden=True)
+    @commands.has_permissions(manage_messages=True)
+    async def searchlogs(self, ctx, query: str, user: Optional[discord.User] = None, channel: Optional[discord.TextChannel] = None, after: Optional[str] = None, before: Optional[str] = None):
+        """Searches logged chat for a phrase.
+
+        Optionally filter by user, channel and a date range. Dates are formatted as 'YYYY-MM-DD'. Example: $searchlogs "free nitro" @user #general 2025-01-01 2025-02-01
+        """
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.defer(ephemeral=True)
+
+        try:
+            start = parse_date_bound(after)
+            end = parse_date_bound(before, end=True)
+        except ValueError:
+            await ctx.reply("Invalid date format. Please use 'YYYY-MM-DD'.")
+            return
+
+        filters = {
+            "author_id": user.id if user else None,
+            "channel_id": channel.id if channel else None,
+            "start": start,
+            "end": end
+        }
+        total = await asyncio.to_thread(self.message_archive.count_search, query, **filters)
+        if total == 0:
+            await ctx.reply(f"No logged messages found matching `{query}`.")
+            return
+
+        def fetch_page(offset, limit):
+            return self.message_archive.search(query, limit=limit, offset=offset, **filters)
+
+        view = LogResultsView(ctx.author.id, f"Search results for \"{query}\"", fetch_page, total)
+        embed = await view.build_embed()
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.reply(embed=embed, view=view, ephemeral=True)
+        else:
+            await ctx.reply(embed=embed, view=view)
+
+    @commands.hybrid_command(hidden=True)
+    @commands.has_permissions(manage_messages=True)
+    async def userlog(self, ctx, user: discord.User, days: Optional[int] = None):
+        """Shows everything a user has posted across all channels, including edited and deleted messages.
+
+        Optionally limit it to the last number of days. Example: $userlog @user 7
+        """
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.defer(ephemeral=True)
+
+        since = None
+        if days is not None:
+            since = (datetime.now(self.timezone) - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
 
-            self.save_message_log(channel_id, message_log)
+        total = await asyncio.to_thread(self.message_archive.count_author_messages, user.id, since)
+        if total == 0:
+            await ctx.reply(f"No logged messages found for {user.name}.")
+            return
+
+        def fetch_page(offset, limit):
+            return self.message_archive.get_author_messages(user.id, since, limit=limit, offset=offset)
 
+        title = f"Messages from {user.name}" + (f" in the last {days} days" if days is not None else "")
+        view = LogResultsView(ctx.author.id, title, fetch_page, total)
+        embed = await view.build_embed()
         if isinstance(ctx.interaction, discord.Interaction):
-            await ctx.reply(f"Logged {total_messages_logged} messages across all channels.", ephemeral=True)
+            await ctx.reply(embed=embed, view=view, ephemeral=True)
         else:
-            await ctx.reply(f"Logged {total_messages_logged} messages across all channels.")
-        
+            await ctx.reply(embed=embed, view=view)
+
+    @commands.hybrid_command(hidden=True)
+    @commands.has_permissions(manage_messages=True)
+    async def exportlogs(self, ctx, channels: Optional[str] = None, user: Optional[discord.User] = None, after: Optional[str] = None, before: Optional[str] = None, format: str = "ndjson"):
+        """Exports logged chat as a gzipped NDJSON or CSV file.
+
+        Channels are given as mentions or IDs, quoted together for more than one, or `all`. Dates are formatted as 'YYYY-MM-DD'.
+        Example: $exportlogs "#general #memes" @user 2025-01-01 2025-02-01 csv
+        """
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.defer(ephemeral=True)
+
+        format = format.lower()
+        if format not in EXPORT_FORMATS:
+            await ctx.reply(f"Invalid format. Please use one of {', '.join(EXPORT_FORMATS)}.")
+            return
+
+        channel_ids = None
+        if channels and channels.lower() != "all":
+            channel_ids = re.findall(r"\d{15,20}", channels)
+            if not channel_ids:
+                await ctx.reply("Invalid channels. Please use channel mentions, IDs or `all`.")
+                return
+
+        try:
+            start = parse_date_bound(after)
+            end = parse_date_bound(before, end=True)
+        except ValueError:
+            await ctx.reply("Invalid date format. Please use 'YYYY-MM-DD'.")
+            return
+
+        # Written to disk as it is read, so the export never holds more than a chunk of rows in memory
+        os.makedirs(self.export_dir, exist_ok=True)
+        filename = f"chat_export_{datetime.now(self.timezone).strftime('%Y%m%d_%H%M%S')}.{format}.gz"
+        output_path = os.path.join(self.export_dir, filename)
+        count = await asyncio.to_thread(export_messages, self.message_archive.db_path, output_path, format,
+                                        channel_ids=channel_ids, author_id=user.id if user else None, start=start, end=end)
+        if count == 0:
+            os.remove(output_path)
+            await ctx.reply("No logged messages found to export.")
+            return
+
+        # Too big to upload, so leave it on the data volume instead
+        if os.path.getsize(output_path) > ctx.guild.filesize_limit:
+            await ctx.reply(f"Exported {count} messages. The export is too large to upload, it was saved to `{output_path}`.")
+            return
+
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.reply(f"Exported {count} messages.", file=discord.File(output_path), ephemeral=True)
+        else:
+            await ctx.reply(f"Exported {count} messages.", file=discord.File(output_path))
+        os.remove(output_path)
+
+    @commands.hybrid_command(hidden=True)
+    @commands.has_permissions(manage_messages=True)
+    async def edithistory(self, ctx, message_link: str, version: Optional[int] = None):
+        """Shows every version of an edited message.
+
+        Pass a message link or ID, and optionally a version number to show that version in full. Version 0 is the original message.
+        """
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.defer(ephemeral=True)
+
+        match = re.search(r'(\d+)/?$', message_link.strip())
+        if not match:
+            await ctx.reply("Invalid message link. Please use a message link or message ID.")
+            return
+        message_id = int(match.group(1))
+
+        if version is not None:
+            versions = await asyncio.to_thread(self.message_archive.get_versions, message_id, version, version)
+            total = None
+        else:
+            # Only the last 25 versions fit in the embed, so only rebuild those
+            total = await asyncio.to_thread(self.message_archive.count_revisions, message_id) + 1
+            versions = await asyncio.to_thread(self.message_archive.get_versions, message_id, max(0, total - 25))
+        if versions is None:
+            await ctx.reply(f"Message with ID {message_id} not found in the message archive.")
+            return
+        if not versions:
+            await ctx.reply(f"Message with ID {message_id} doesn't have a version {version}.")
+            return
+
+        message = await asyncio.to_thread(self.message_archive.get_message, message_id)
+        embed = discord.Embed(
+            title="Edit History",
+            description=f"Message from <@{message['author_id']}> in <#{message['channel_id']}>\n[Jump to message]({message['jump_url']})",
+            color=discord.Color.og_blurple()
+        )
+
+        if version is not None:
+            number, timestamp, content = versions[0]
+            embed.description += f"\n\n**Version {number}** ({timestamp or 'unknown time'})\n{content[:3800] or '*No text content*'}"
+        else:
+            # Embeds fit 25 fields and 6000 characters, so share the space between the versions
+            max_length = min(1000, 4500 // len(versions))
+            for number, timestamp, content in versions:
+                label = "Original" if number == 0 else f"Version {number}"
+                if len(content) > max_length:
+                    content = content[:max_length - 3] + "..."
+                embed.add_field(name=f"{label} ({timestamp or 'unknown time'})", value=content or "*No text content*", inline=False)
+            if total > len(versions):
+                embed.set_footer(text=f"Showing the last {len(versions)} of {total} versions. Pass a version number to see older ones.")
+
+        if isinstance(ctx.interaction, discord.Interaction):
+            await ctx.reply(embed=embed, ephemeral=True)
+        else:
+            await ctx.reply(embed=embed)
+
     @commands.hybrid_command(hidden=True)
     @commands.has_permissions(administrator=True)
     async def sync(self, ctx):
@@ -107,5 +523,55 @@ class ModerationCommands(commands.Cog):
         else:
              await ctx.reply('Command tree synced.')
 
+class LogResultsView(discord.ui.View):
+    def __init__(self, user_id, title, fetch_page, total, page_size=10):
+        super().__init__(timeout=600)
+        self.user_id = user_id
+        self.title = title
+        self.fetch_page = fetch_page  # Called as fetch_page(offset, limit) in a worker thread, returns archive rows
+        self.total = total
+        self.page_size = page_size
+        self.page = 0
+
+    @property
+    def page_count(self):
+        return max(1, math.ceil(self.total / self.page_size))
+
+    async def build_embed(self):
+        """Build the embed for the current page, fetching its rows from the archive"""
+        rows = await asyncio.to_thread(self.fetch_page, self.page * self.page_size, self.page_size)
+
+        embed = discord.Embed(title=self.title[:256], color=discord.Color.blurple())
+        for row in rows:
+            name = f"{row['author_name']} in #{row['channel_name']} at {row['created_at']}"
+            if row.get("deleted_at"):
+                name += " (deleted)"
+            elif row.get("edited_at"):
+                name += " (edited)"
+
+            content = row["content"] or "*No text content*"
+            if len(content) > 250:
+                content = content[:247] + "..."
+            embed.add_field(name=name[:100], value=f"{content}\n[Jump to message]({row['jump_url']})", inline=False)
+
+        embed.set_footer(text=f"Page {self.page + 1}/{self.page_count} - {self.total} results")
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= self.page_count - 1
+        return embed
+
+    async def interaction_check(self, interaction):
+        # Only the moderator who ran the command can page through the results
+        return interaction.user.id == self.user_id
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_button(self, interaction, button):
+        self.page = max(0, self.page - 1)
+        await interaction.response.edit_message(embed=await self.build_embed(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction, button):
+        self.page = min(self.page_count - 1, self.page + 1)
+        await interaction.response.edit_message(embed=await self.build_embed(), view=self)
+
 async def setup(bot):
     await bot.add_cog(ModerationCommands(bot))
@@ -1,11 +1,17 @@
+import asyncio
+import io
 import json
 import os
-import difflib
 import discord
 from discord.ext import commands, tasks
 import pytz
-import re
-from datetime import datetime
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from utils.roleworker import RoleWorker
+from utils.simhash import SimhashIndex, simhash
+from utils.spam import FloodDetector, RaidTracker, account_age_histogram, name_pattern
+from utils.textdiff import ANSI_DELETED, ANSI_INSERTED, diff_segments, format_ansi_fields, render_word_diff
 
 class ModerationEvents(commands.Cog):
     def __init__(self, bot):
@@ -13,12 +19,72 @@ class ModerationEvents(commands.Cog):
         with open('secrets.json') as config_file:
             self.config = json.load(config_file)
 
-        self.chat_logs_dir = "chat_logs"
-        if not os.path.exists(self.chat_logs_dir):
-            os.makedirs(self.chat_logs_dir)
+        # Shared write-behind chat log cache, created in bot.py
+        self.chat_logs = bot.chat_logs
+        self.message_archive = bot.message_archive
+
+        # Shared batching sender for everything posted to the log channels
+        self.log_sender = bot.log_sender
+
+        # Retention policy, messages older than the hot window are moved to compressed monthly archives
+        self.chat_log_hot_days = int(self.config.get("CHAT_LOG_HOT_DAYS", 30))
+        self.chat_log_expire_days = int(self.config.get("CHAT_LOG_EXPIRE_DAYS", 0))  # 0 keeps messages forever
 
         self.timezone = pytz.timezone(self.config["TIMEZONE"])
 
+        # Number of edits that needed an API fetch because the gateway payload was incomplete
+        self.edit_fetch_fallbacks = 0
+
+        # Each side of an edit diff gets at most this many 1024 character embed fields before it is attached as a file
+        self.max_diff_fields = 2
+
+        # Index of members missing the join role, worked through a few at a time
+        self.role_worker = RoleWorker(bot, self.config["NEW_USER_JOIN_ROLE_ID"], on_assigned=self.log_role_assigned,
+                                      concurrency=int(self.config.get("ROLE_WORKER_CONCURRENCY", 2)))
+
+        # Flood protection, users over the limits are timed out and flooded channels are locked for a while
+        self.spam_protection = self.config.get("SPAM_PROTECTION", True)
+        self.flood_detector = FloodDetector(
+            user_messages=int(self.config.get("SPAM_USER_MESSAGES", 6)),
+            user_seconds=float(self.config.get("SPAM_USER_SECONDS", 8)),
+            duplicate_messages=int(self.config.get("SPAM_DUPLICATE_MESSAGES", 3)),
+            duplicate_seconds=float(self.config.get("SPAM_DUPLICATE_SECONDS", 60)),
+            duplicate_min_length=int(self.config.get("SPAM_DUPLICATE_MIN_LENGTH", 10)),
+            channel_messages=int(self.config.get("SPAM_CHANNEL_MESSAGES", 40)),
+            channel_seconds=float(self.config.get("SPAM_CHANNEL_SECONDS", 10))
+        )
+        self.spam_timeout = timedelta(minutes=float(self.config.get("SPAM_TIMEOUT_MINUTES", 10)))
+        self.spam_channel_lock_seconds = float(self.config.get("SPAM_CHANNEL_LOCK_MINUTES", 5)) * 60
+        self.spam_actions = set()  # user and channel IDs with a timeout or lock in progress
+        # Channels locked right now, so a reload or restart can't leave a lock in place for good
+        self.flood_lock_file = "flood_locks.json"
+        self.flood_locks = {}  # channel ID -> send_messages overwrite @everyone had before the lock
+        if os.path.exists(self.flood_lock_file):
+            with open(self.flood_lock_file) as f:
+                self.flood_locks = json.load(f)
+        self.flood_lock_tasks = {}  # channel ID -> task lifting the lock when it runs out
+        self.spam_incidents = []  # lines for the next flood protection summary
+        self.spam_summary_task = None
+
+        # Near-duplicate detection, the same message posted with small variations across several channels is flagged
+        self.duplicate_detection = self.config.get("DUPLICATE_DETECTION", True)
+        self.duplicate_index = SimhashIndex(
+            max_distance=int(self.config.get("DUPLICATE_MAX_DISTANCE", 8)),
+            window_seconds=float(self.config.get("DUPLICATE_WINDOW_MINUTES", 10)) * 60
+        )
+        self.duplicate_min_channels = int(self.config.get("DUPLICATE_MIN_CHANNELS", 3))
+        self.duplicate_min_length = int(self.config.get("DUPLICATE_MIN_LENGTH", 20))
+        self.duplicate_auto_delete = self.config.get("DUPLICATE_AUTO_DELETE", False)
+
+        # Raid mode, above this join rate auto-role is paused and joins are summarized instead of logged one by one
+        self.raid_tracker = RaidTracker(
+            join_count=int(self.config.get("RAID_JOIN_COUNT", 10)),
+            join_seconds=float(self.config.get("RAID_JOIN_SECONDS", 60)),
+            cooldown_seconds=float(self.config.get("RAID_COOLDOWN_SECONDS", 120))
+        )
+        self.raid_summary_seconds = float(self.config.get("RAID_SUMMARY_SECONDS", 30))
+        self.raid_task = None
+
         self.ignored_message_ids = set(self.config.get("IGNORED_MESSAGE_IDS", []))
 
         self.alternate_log_channels = {}
@@ -30,31 +96,19 @@ class ModerationEvents(commands.Cog):
                 message_ids = [msg_id.strip() for msg_id in message_ids_str.split(',')]
                 self.alternate_log_channels[channel_id] = set(message_ids)
 
-    def get_message_log_file(self, channel_id):
-        return os.path.join(self.chat_logs_dir, f"message_log_{channel_id}.json")
-
-    def load_message_log(self, channel_id):
-        file_path = self.get_message_log_file(channel_id)
-        try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-
-    def save_message_log(self, channel_id, message_log):
-        file_path = self.get_message_log_file(channel_id)
-        with open(file_path, 'w') as f:
-            json.dump(message_log, f, indent=4)
+    async def load_message_log(self, channel_id):
+        return await self.chat_logs.get_log(channel_id)
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
-        role_id = int(self.config["NEW_USER_JOIN_ROLE_ID"])
-        role = discord.utils.get(member.guild.roles, id=role_id)
-        if role:
-            await member.add_roles(role)
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Added {role.name} to {member.name}.")
-        else:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) User {member.name} joined the server, but role with ID {role_id} not found.")
+        # Queue the join role, the role worker paces the API calls when many members join at once
+        self.role_worker.track(member, "join")
+
+        if self.raid_tracker.add_join(time.monotonic()):
+            self.start_raid_mode()
+        if self.raid_tracker.active:
+            self.raid_tracker.pending_joins.append(member)  # Summarized by the raid summary loop instead
+            return
 
         # Log the join event
         join_time = datetime.now(self.timezone)
@@ -67,16 +121,16 @@ class ModerationEvents(commands.Cog):
         embed.add_field(name="Username", value=member.name, inline=False)
         embed.add_field(name="User ID", value=member.id, inline=False)
 
-        logs_channel_id = int(self.config["LOGS_CHANNEL_ID"])
-        logs_channel = self.bot.get_channel(logs_channel_id)  # Get the logs channel
-        if not logs_channel:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Logs channel with ID {logs_channel_id} not found.")
-            return
-
-        await logs_channel.send(embed=embed)  # Send the embed
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed)  # Queue the embed for the logs channel
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member):
+        self.role_worker.discard(member.id)
+
+        if self.raid_tracker.active:
+            self.raid_tracker.pending_leaves += 1
+            return
+
         # Log the leave event
         leave_time = datetime.now(self.timezone)
         embed = discord.Embed(
@@ -88,21 +142,97 @@ class ModerationEvents(commands.Cog):
         embed.add_field(name="Username", value=member.name, inline=False)
         embed.add_field(name="User ID", value=member.id, inline=False)
 
-        logs_channel_id = int(self.config["LOGS_CHANNEL_ID"])
-        logs_channel = self.bot.get_channel(logs_channel_id)  # Get the logs channel
-        if not logs_channel:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Logs channel with ID {logs_channel_id} not found.")
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed)
+
+    def start_raid_mode(self):
+        # Joined members stay in the role worker's index and get the role once the raid is over
+        self.role_worker.pause()
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Raid mode enabled, {len(self.raid_tracker.join_times)} joins in {self.raid_tracker.join_seconds:g}s.")
+
+        embed = discord.Embed(
+            title="Raid Mode Enabled",
+            description=(f"{len(self.raid_tracker.join_times)} members joined in {self.raid_tracker.join_seconds:g} seconds. "
+                         f"Auto-role is paused and joins will be summarized every {self.raid_summary_seconds:g} seconds."),
+            color=discord.Color.dark_red(),
+            timestamp=datetime.now(self.timezone)
+        )
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed)
+        self.raid_task = asyncio.create_task(self.run_raid_mode())
+
+    async def run_raid_mode(self):
+        try:
+            while not self.raid_tracker.is_over(time.monotonic()):
+                await asyncio.sleep(self.raid_summary_seconds)
+                await self.send_raid_summary()
+        finally:
+            self.raid_tracker.active = False
+            self.role_worker.resume()
+
+        await self.send_raid_summary()
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Raid mode ended, resuming auto-role for {len(self.role_worker.missing)} members.")
+        embed = discord.Embed(
+            title="Raid Mode Ended",
+            description=f"The join rate has dropped. Auto-role has resumed for {len(self.role_worker.missing)} members and joins are logged individually again.",
+            color=discord.Color.green(),
+            timestamp=datetime.now(self.timezone)
+        )
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed)
+
+    async def send_raid_summary(self):
+        joins, leaves = self.raid_tracker.take_pending()
+        if not joins and not leaves:
             return
 
-        await logs_channel.send(embed=embed)
+        now = discord.utils.utcnow()
+        embed = discord.Embed(
+            title="Raid Summary",
+            description=f"{len(joins)} members joined and {leaves} left since the last summary.",
+            color=discord.Color.dark_red(),
+            timestamp=datetime.now(self.timezone)
+        )
+
+        if joins:
+            histogram = account_age_histogram((member.created_at for member in joins), now)
+            widest = max(count for _, count in histogram)
+            embed.add_field(name="Account Age", value="```\n" + "\n".join(
+                f"{label:<10} {'#' * round(count / widest * 20):<20} {count}" for label, count in histogram) + "```", inline=False)
+
+            patterns = Counter(name_pattern(member.name) for member in joins)
+            repeated = [(pattern, count) for pattern, count in patterns.most_common(5) if count > 1]
+            pattern_lines = [f"`{pattern}` x{count}" for pattern, count in repeated]
+            default_avatars = sum(1 for member in joins if member.avatar is None)
+            pattern_lines.append(f"{default_avatars} with no avatar")
+            embed.add_field(name="Name Patterns", value="\n".join(pattern_lines)[:1024], inline=False)
+
+        # Full member list for the record, the buttons act on exactly these members
+        member_list = "\n".join(f"{member.id}\t{member.name}\tcreated {member.created_at.strftime('%Y-%m-%d %H:%M:%S')} UTC" for member in joins)
+        file = discord.File(io.BytesIO(member_list.encode('utf-8')), filename=f"raid_joins_{datetime.now(self.timezone).strftime('%Y%m%d_%H%M%S')}.txt") if joins else None
+
+        # Sent directly rather than batched since it carries the action buttons
+        logs_channel = self.bot.get_channel(int(self.config["LOGS_CHANNEL_ID"]))
+        if not logs_channel:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Logs channel with ID {self.config['LOGS_CHANNEL_ID']} not found.")
+            return
+        try:
+            if joins:
+                await logs_channel.send(embed=embed, file=file, view=RaidActionView([member.id for member in joins]))
+            else:
+                await logs_channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Error sending raid summary: {e}")
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.author.bot:
             return  # Ignore messages from bots
 
+        # Flood checks only touch memory, anything they trigger runs in the background
+        if self.spam_protection and message.guild:
+            exceeded = self.flood_detector.check(time.monotonic(), message.author.id, message.channel.id, message.content)
+            if exceeded:
+                self.handle_flood(message, exceeded)
+
         channel_id = str(message.channel.id)
-        message_log = self.load_message_log(channel_id)
 
         # Convert the message's created_at timestamp to the specified timezone
         created_at_pacific = message.created_at.astimezone(self.timezone)
@@ -117,8 +247,189 @@ class ModerationEvents(commands.Cog):
             "jump_url": message.jump_url
         }
 
-        message_log[str(message.id)] = message_data
-        self.save_message_log(channel_id, message_log)
+        self.chat_logs.log_message(channel_id, message.id, message_data)
+
+        if self.duplicate_detection and message.guild:
+            self.check_near_duplicates(message, message_data)
+
+        await self.chat_logs.flush_if_needed()
+
+    def check_near_duplicates(self, message, message_data):
+        content = message_data["content"]
+        if len(content) < self.duplicate_min_length:
+            return  # Short messages like "gg" repeat everywhere
+        if isinstance(message.author, discord.Member) and message.author.guild_permissions.manage_messages:
+            return  # Moderators post announcements in several channels
+
+        fingerprint = simhash(content)
+        if fingerprint is None:
+            return
+
+        now = time.monotonic()
+        matches = self.duplicate_index.find(now, fingerprint)
+        entry = {
+            "message_id": str(message.id),
+            "channel_id": message_data["channel_id"],
+            "author_id": message_data["author_id"],
+            "content": content,
+            "jump_url": message_data["jump_url"],
+            "flagged": False
+        }
+        self.duplicate_index.add(now, fingerprint, entry)
+
+        channel_ids = {match["channel_id"] for match in matches} | {entry["channel_id"]}
+        if len(channel_ids) < self.duplicate_min_channels:
+            return
+
+        # Only report messages that weren't part of an earlier report
+        flagged = [match for match in matches if not match["flagged"]] + [entry]
+        for match in flagged:
+            match["flagged"] = True
+        self.flag_near_duplicates(flagged, len(matches) + 1, channel_ids)
+
+    def flag_near_duplicates(self, flagged, total, channel_ids):
+        embed = discord.Embed(
+            title="Near-Duplicate Messages",
+            description=flagged[-1]["content"][:1000],
+            color=discord.Color.orange(),
+            timestamp=datetime.now(self.timezone)
+        )
+        author_ids = list(dict.fromkeys(match["author_id"] for match in flagged))
+        embed.add_field(name="Authors", value=", ".join(f"<@{author_id}>" for author_id in author_ids)[:1024], inline=False)
+        embed.add_field(name="Channels", value=", ".join(f"<#{channel_id}>" for channel_id in sorted(channel_ids))[:1024], inline=False)
+
+        links = ""
+        for index, match in enumerate(flagged):
+            if len(links) + len(match["jump_url"]) > 1000:
+                links += f"...and {len(flagged) - index} more"
+                break
+            links += match["jump_url"] + "\n"
+        embed.add_field(name=f"Messages ({len(flagged)} new, {total} similar in the last {self.duplicate_index.window_seconds / 60:g} minutes)", value=links, inline=False)
+
+        if self.duplicate_auto_delete:
+            embed.add_field(name="Action", value="Deleted automatically.", inline=False)
+            asyncio.create_task(self.delete_near_duplicates(flagged))
+
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed)
+
+    async def delete_near_duplicates(self, flagged):
+        by_channel = {}
+        for match in flagged:
+            by_channel.setdefault(match["channel_id"], []).append(discord.Object(id=int(match["message_id"])))
+
+        # One bulk delete per channel, logged as a single summary by on_raw_bulk_message_delete
+        for channel_id, messages in by_channel.items():
+            channel = self.bot.get_channel(int(channel_id))
+            if not channel:
+                continue
+            try:
+                await channel.delete_messages(messages, reason="Near-duplicate spam")
+            except discord.HTTPException as e:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Error deleting near-duplicate messages in channel {channel_id}: {e}")
+
+    def handle_flood(self, message, exceeded):
+        member = message.author
+        is_moderator = isinstance(member, discord.Member) and member.guild_permissions.manage_messages
+        for kind, count in exceeded:
+            if kind == "channel":
+                if message.channel.id not in self.spam_actions:
+                    self.spam_actions.add(message.channel.id)
+                    self.flood_lock_tasks[message.channel.id] = asyncio.create_task(self.lock_flooded_channel(message.channel, count))
+            elif not is_moderator and isinstance(member, discord.Member) and member.id not in self.spam_actions:
+                self.spam_actions.add(member.id)
+                reason = f"sent {count} copies of the same message" if kind == "duplicate" else f"sent {count} messages in {self.flood_detector.user_seconds:g}s"
+                asyncio.create_task(self.timeout_spammer(member, message.channel, reason))
+
+    async def timeout_spammer(self, member, channel, reason):
+        try:
+            await member.timeout(self.spam_timeout, reason=f"Flood protection: {reason}")
+            self.add_spam_incident(f"Timed out {member.mention} ({member.name}) in {channel.mention}, {reason}.")
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Timed out {member.name} for flooding, {reason}.")
+        except discord.HTTPException as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Error timing out {member.name} for flooding: {e}")
+        finally:
+            self.flood_detector.reset_user(member.id)
+            self.spam_actions.discard(member.id)
+
+    async def lock_flooded_channel(self, channel, count):
+        default_role = channel.guild.default_role
+        try:
+            overwrite = channel.overwrites_for(default_role)
+            previous_send_messages = overwrite.send_messages
+            overwrite.send_messages = False
+            self.save_flood_lock(channel.id, previous_send_messages)
+            await channel.set_permissions(default_role, overwrite=overwrite, reason=f"Flood protection: {count} messages in {self.flood_detector.channel_seconds:g}s")
+            self.add_spam_incident(f"Locked {channel.mention} for {self.spam_channel_lock_seconds / 60:g} minutes after {count} messages in {self.flood_detector.channel_seconds:g}s.")
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Locked channel {channel.name} for flooding.")
+
+            try:
+                await asyncio.sleep(self.spam_channel_lock_seconds)
+            finally:
+                # Also runs when the cog is unloaded mid-lock, which cancels this task
+                await self.unlock_flooded_channel(channel, previous_send_messages, "Flood protection lock expired")
+        except discord.HTTPException as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Error locking channel {channel.name} for flooding: {e}")
+            self.forget_flood_lock(channel.id)
+        finally:
+            self.flood_detector.reset_channel(channel.id)
+            self.spam_actions.discard(channel.id)
+            self.flood_lock_tasks.pop(channel.id, None)
+
+    async def unlock_flooded_channel(self, channel, previous_send_messages, reason):
+        default_role = channel.guild.default_role
+        try:
+            # Put back whatever the channel had before, rather than assuming it was unset
+            overwrite = channel.overwrites_for(default_role)
+            overwrite.send_messages = previous_send_messages
+            await channel.set_permissions(default_role, overwrite=None if overwrite.is_empty() else overwrite, reason=reason)
+            self.forget_flood_lock(channel.id)
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Unlocked channel {channel.name}.")
+        except discord.HTTPException as e:
+            # Left in the lock file so the next startup tries again
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Error unlocking channel {channel.name}: {e}")
+
+    async def restore_flood_locks(self):
+        """Lift locks that were still in place when the bot last stopped"""
+        for channel_id, previous_send_messages in list(self.flood_locks.items()):
+            channel = self.bot.get_channel(int(channel_id))
+            if channel is None:
+                self.forget_flood_lock(channel_id)
+                continue
+            await self.unlock_flooded_channel(channel, previous_send_messages, "Flood protection lock left over from before a restart")
+
+    def save_flood_lock(self, channel_id, previous_send_messages):
+        self.flood_locks[str(channel_id)] = previous_send_messages
+        self.write_flood_locks()
+
+    def forget_flood_lock(self, channel_id):
+        if str(channel_id) in self.flood_locks:
+            del self.flood_locks[str(channel_id)]
+            self.write_flood_locks()
+
+    def write_flood_locks(self):
+        with open(self.flood_lock_file, 'w') as f:
+            json.dump(self.flood_locks, f)
+
+    def add_spam_incident(self, line):
+        self.spam_incidents.append(line)
+        if self.spam_summary_task is None or self.spam_summary_task.done():
+            self.spam_summary_task = asyncio.create_task(self.send_spam_summary())
+
+    async def send_spam_summary(self):
+        # Give the rest of a raid a moment to land so it is reported as one summary
+        await asyncio.sleep(15)
+        incidents, self.spam_incidents = self.spam_incidents, []
+
+        description = "\n".join(incidents)
+        if len(description) > 4000:
+            description = description[:4000].rsplit("\n", 1)[0] + f"\n...and more, {len(incidents)} actions in total."
+        embed = discord.Embed(
+            title="Flood Protection",
+            description=description,
+            color=discord.Color.orange(),
+            timestamp=datetime.now(self.timezone)
+        )
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed)
 
     @commands.Cog.listener()
     async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
@@ -127,38 +438,38 @@ class ModerationEvents(commands.Cog):
 
         message_id = str(payload.message_id)
         channel_id = str(payload.channel_id)
-        message_log = self.load_message_log(channel_id)
 
         # Check list in secrets if there's a message ID to ignore
         if str(payload.message_id) in self.ignored_message_ids:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Message with ID {message_id} was edited but is marked to be ignored.")
             return
 
-        if message_id not in message_log:
+        message_data = await self.chat_logs.get_message(channel_id, message_id)
+        if message_data is None:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Message with ID {message_id} not found in the log for channel {channel_id}.")
             return
 
-        message_data = message_log[message_id]
-
-        guild_id = str(payload.guild_id)
-        guild = self.bot.get_guild(int(guild_id))  # Get the guild
-        if not guild:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Guild with ID {guild_id} not found.")
-            return
+        # Build the edit from the gateway payload, the update carries the new content and edit time already
+        edited_content = payload.data.get("content")
+        edited_timestamp = payload.data.get("edited_timestamp")
+        if edited_content is not None and message_data["content"] == edited_content:
+            return  # Ignore if the content hasn't changed, like link embeds loading
 
-        channel = guild.get_channel(int(channel_id))  # Get the channel
-        if not channel:  # Get the channel
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Channel with ID {channel_id} not found.")
-            return
+        if edited_content is None or edited_timestamp is None:
+            # Only go to the API when the payload is missing what we need
+            message = await self.fetch_edited_message(payload)
+            if message is None:
+                return
+            edited_content = message.content
+            edited_at = message.edited_at or datetime.now(self.timezone)
 
-        try:
-            message = await channel.fetch_message(int(message_id))  # Fetch the message
-        except discord.NotFound:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Message with ID {message_id} not found.")
-            return
+            if message_data["content"] == edited_content:
+                return  # Ignore if the content hasn't changed
+        else:
+            edited_at = discord.utils.parse_time(edited_timestamp)
 
-        if message_data["content"] == message.content:
-            return  # Ignore if the content hasn't changed
+        author_id = payload.data.get("author", {}).get("id") or message_data["author_id"]
+        jump_url = message_data.get("jump_url") or f"https://discord.com/channels/{payload.guild_id}/{channel_id}/{message_id}"
 
         # Check if this message should go to an alternate channel
         alternate_channel_id = None
@@ -168,37 +479,21 @@ class ModerationEvents(commands.Cog):
                 break
 
         # Convert the message's edited_at timestamp to the specified timezone
-        edited_at_pacific = message.edited_at.astimezone(self.timezone)
+        edited_at_pacific = edited_at.astimezone(self.timezone)
 
-        # Create a word-level diff
+        # Create a word-level diff using ansi highlight codes, with unchanged text collapsed around the changes
         original_content = message_data["content"]
-        edited_content = message.content
-
-        original_words = list(original_content)
-        edited_words = list(edited_content)
-
-        highlighted_original = ""
-        highlighted_edited = ""
-        matcher = difflib.SequenceMatcher(None, original_words, edited_words)
-
-        # Create git diff-like formatting using ansi highlight codes
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-            if tag == 'equal':
-                highlighted_original += "".join(original_words[i1:i2])
-                highlighted_edited += "".join(edited_words[j1:j2])
-            elif tag == 'delete':
-                highlighted_original += f"[2;41m{''.join(original_words[i1:i2])}[0m"
-                highlighted_edited += ""
-            elif tag == 'insert':
-                highlighted_original += ""
-                highlighted_edited += f"[2;42m{''.join(edited_words[j1:j2])}[0m"
-            elif tag == 'replace':
-                highlighted_original += f"[2;41m{''.join(original_words[i1:i2])}[0m"
-                highlighted_edited += f"[2;42m{''.join(edited_words[j1:j2])}[0m"
-
-        # Remove trailing spaces
-        highlighted_original = highlighted_original.rstrip()
-        highlighted_edited = highlighted_edited.rstrip()
+        before_segments, after_segments = diff_segments(original_content, edited_content)
+        before_fields = format_ansi_fields(before_segments, ANSI_DELETED)
+        after_fields = format_ansi_fields(after_segments, ANSI_INSERTED)
+
+        # Attach the full diff as a file if it won't fit in a couple of fields per side
+        diff_file = None
+        if len(before_fields) > self.max_diff_fields or len(after_fields) > self.max_diff_fields:
+            before_fields = before_fields[:self.max_diff_fields]
+            after_fields = after_fields[:self.max_diff_fields]
+            diff_text = f"Before:\n{original_content}\n\nAfter:\n{edited_content}\n\nWord diff:\n{render_word_diff(original_content, edited_content)}\n"
+            diff_file = discord.File(io.BytesIO(diff_text.encode('utf-8')), filename=f"edit_{message_id}.diff")
 
         # Create embed with proper formatting
         embed = discord.Embed(
@@ -206,33 +501,48 @@ class ModerationEvents(commands.Cog):
             color=discord.Color.og_blurple(),
             timestamp=edited_at_pacific
         )
-        embed.add_field(name="Author", value=message.author.mention, inline=False)
-        embed.add_field(name="Channel", value=message.channel.mention, inline=False)
-        embed.add_field(name="Before", value=f"```ansi\n{highlighted_original}```", inline=False)
-        embed.add_field(name="After", value=f"```ansi\n{highlighted_edited}```", inline=False)
-        embed.add_field(name="Message Link", value=message.jump_url, inline=False)
-
-        if alternate_channel_id:
-            logs_channel = self.bot.get_channel(int(alternate_channel_id))
-            if logs_channel:
-                await logs_channel.send(embed=embed)  # Send to alternate channel
-            else:
-                # Fallback to default channel if alternate channel is not found
-                default_logs_channel_id = int(self.config["LOGS_CHANNEL_ID"])
-                default_logs_channel = self.bot.get_channel(default_logs_channel_id)
-                if default_logs_channel:
-                    await default_logs_channel.send(embed=embed)
+        embed.add_field(name="Author", value=f"<@{author_id}>", inline=False)
+        embed.add_field(name="Channel", value=f"<#{channel_id}>", inline=False)
+        for index, field in enumerate(before_fields):
+            embed.add_field(name="Before" if index == 0 else "Before (continued)", value=field, inline=False)
+        for index, field in enumerate(after_fields):
+            embed.add_field(name="After" if index == 0 else "After (continued)", value=field, inline=False)
+        if diff_file:
+            embed.add_field(name="Full Diff", value="Too long to show here, see the attached file.", inline=False)
+        embed.add_field(name="Message Link", value=jump_url, inline=False)
+
+        if alternate_channel_id and self.bot.get_channel(int(alternate_channel_id)):
+            self.log_sender.send(alternate_channel_id, embed, diff_file)  # Send to alternate channel
         else:
-            # Send to default channel
-            logs_channel_id = int(self.config["LOGS_CHANNEL_ID"])
-            logs_channel = self.bot.get_channel(logs_channel_id)
-            if logs_channel:
-                await logs_channel.send(embed=embed)
+            # Send to default channel, also the fallback if the alternate channel is not found
+            self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed, diff_file)
+
+        # Append the edit to the message log
+        await self.chat_logs.log_edit(channel_id, message_id, edited_content, edited_at_pacific.strftime('%Y-%m-%d %H:%M:%S'))
+        await self.chat_logs.flush_if_needed()
 
-        # Update the message log
-        message_data["content"] = message.content
-        message_data["edited_at"] = edited_at_pacific.strftime('%Y-%m-%d %H:%M:%S')
-        self.save_message_log(channel_id, message_log)
+    async def fetch_edited_message(self, payload):
+        """Fetch an edited message through the API when the gateway payload doesn't have enough to log it"""
+        self.edit_fetch_fallbacks += 1
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Edit payload for message {payload.message_id} is incomplete, fetching it ({self.edit_fetch_fallbacks} fetches so far).")
+
+        guild_id = str(payload.guild_id)
+        guild = self.bot.get_guild(int(guild_id))  # Get the guild
+        if not guild:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Guild with ID {guild_id} not found.")
+            return None
+
+        channel_id = str(payload.channel_id)
+        channel = guild.get_channel(int(channel_id))  # Get the channel
+        if not channel:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Channel with ID {channel_id} not found.")
+            return None
+
+        try:
+            return await channel.fetch_message(payload.message_id)  # Fetch the message
+        except discord.NotFound:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Message with ID {payload.message_id} not found.")
+            return None
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
@@ -246,9 +556,9 @@ class ModerationEvents(commands.Cog):
         except:
             message_not_in_cache = True
 
-        message_log = self.load_message_log(channel_id)
+        message_data = await self.chat_logs.get_message(channel_id, message_id)
 
-        if message_id not in message_log:
+        if message_data is None:
             if message_not_in_cache:
                 # Seeing this message in the log file likely means that the message came from a bot since bot messages aren't logged
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Message with ID {message_id} not found in the log for channel {channel_id}, and was not cached.")
@@ -256,8 +566,6 @@ class ModerationEvents(commands.Cog):
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Message with ID {message_id} not found in the log for channel {channel_id}.")
             return
 
-        message_data = message_log[message_id]
-
         # Use the current time for the timestamp
         current_time = datetime.now(self.timezone)
 
@@ -271,69 +579,212 @@ class ModerationEvents(commands.Cog):
         embed.add_field(name="Original Timestamp", value=message_data["created_at"], inline=False)
         embed.add_field(name="Content", value=message_data["content"], inline=False)
 
-        logs_channel_id = int(self.config["LOGS_CHANNEL_ID"])
-        logs_channel = self.bot.get_channel(logs_channel_id)  # Get the logs channel
-        if not logs_channel:
-            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Logs channel with ID {logs_channel_id} not found.")
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed)
+
+        # Mark the message as deleted in the log
+        self.chat_logs.log_delete(channel_id, message_id, current_time.strftime('%Y-%m-%d %H:%M:%S'))
+        await self.chat_logs.flush_if_needed()
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        channel_id = str(payload.channel_id)
+
+        # Bot messages aren't logged, so anything not in the log is skipped
+        logged = await self.chat_logs.get_messages(channel_id, payload.message_ids)
+        deleted_messages = [(str(message_id), logged[str(message_id)]) for message_id in sorted(payload.message_ids) if str(message_id) in logged]
+
+        if not deleted_messages:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) {len(payload.message_ids)} messages were bulk deleted in channel {channel_id}, but none were in the log.")
             return
 
-        await logs_channel.send(embed=embed)
+        # Use the current time for the timestamp
+        current_time = datetime.now(self.timezone)
+
+        # One transcript of everything deleted instead of an embed per message
+        transcript_lines = []
+        author_counts = {}
+        for message_id, message_data in deleted_messages:
+            transcript_lines.append(f"[{message_data['created_at']}] {message_data['author_name']} ({message_data['author_id']}): {message_data['content']}")
+            author_counts[message_data["author_id"]] = author_counts.get(message_data["author_id"], 0) + 1
+        transcript = f"Bulk delete in #{deleted_messages[0][1].get('channel_name', channel_id)} at {current_time.strftime('%Y-%m-%d %H:%M:%S')}\n\n" + "\n".join(transcript_lines) + "\n"
+        transcript_file = discord.File(io.BytesIO(transcript.encode('utf-8')), filename=f"bulk_delete_{channel_id}_{current_time.strftime('%Y%m%d_%H%M%S')}.txt")
+
+        top_authors = sorted(author_counts.items(), key=lambda item: item[1], reverse=True)
+        authors_text = "\n".join(f"<@{author_id}>: {count}" for author_id, count in top_authors[:10])
+        if len(top_authors) > 10:
+            authors_text += f"\n...and {len(top_authors) - 10} more"
+
+        embed = discord.Embed(
+            title="Messages Bulk Deleted",
+            color=discord.Color.blurple(),
+            timestamp=current_time
+        )
+        embed.add_field(name="Channel", value=f"<#{channel_id}>", inline=False)
+        embed.add_field(name="Messages", value=f"{len(deleted_messages)} logged of {len(payload.message_ids)} deleted", inline=False)
+        embed.add_field(name="Original Timestamps", value=f"{deleted_messages[0][1]['created_at']} to {deleted_messages[-1][1]['created_at']}", inline=False)
+        embed.add_field(name="Authors", value=authors_text, inline=False)
+        embed.add_field(name="Transcript", value="See the attached file.", inline=False)
+
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed, transcript_file)
 
-        # Remove the message from the log
-        del message_log[message_id]
-        self.save_message_log(channel_id, message_log)
+        # Mark every message as deleted in one batch
+        self.chat_logs.log_deletes(channel_id, [message_id for message_id, _ in deleted_messages], current_time.strftime('%Y-%m-%d %H:%M:%S'))
+        await self.chat_logs.flush_if_needed()
 
-    @tasks.loop(minutes=10)
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        # Keep the missing role index current as roles change, so it never needs a full scan to notice
+        if self.role_worker.has_role(after):
+            self.role_worker.discard(after.id)
+        elif self.role_worker.has_role(before):
+            self.role_worker.track(after, "removed")
+
+    async def log_role_assigned(self, member, role, reason):
+        if reason == "join":
+            return  # Already covered by the join log
+
+        # Log the role assignment event
+        join_time = datetime.now(self.timezone)
+        embed = discord.Embed(
+            title="Role Assigned",
+            description=f"Role {role.mention} was assigned to {member.mention}.",
+            color=discord.Color.green(),
+            timestamp=join_time
+        )
+        embed.add_field(name="Username", value=member.name, inline=False)
+        embed.add_field(name="User ID", value=member.id, inline=False)
+        embed.add_field(name="Role Assigned", value=role.name, inline=False)
+
+        self.log_sender.send(self.config["LOGS_CHANNEL_ID"], embed)
+
+    @tasks.loop(hours=6)
     async def check_missing_roles(self):
-        # Check users every 10 minutes if they don't have default role in case it wasn't added on join
+        # Membership events keep the index current, this only catches anything missed while disconnected
         try:
             role_id = int(self.config["NEW_USER_JOIN_ROLE_ID"])
 
             # Bot is designed as a single guild bot, so only need to grab first instance in list
             guild = self.bot.guilds[0]
 
-            role = discord.utils.get(guild.roles, id=role_id)
+            role = guild.get_role(role_id)
             if not role:
                 print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Role with ID {role_id} not found in guild {guild.name}")
                 return
 
-            members = guild.members
-            for member in members:
-                if role in member.roles or member.bot:
-                    continue
-
-                try:
-                    await member.add_roles(role)
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Added {role.name} to {member.name}.")
-
-                    # Log the role assignment event
-                    join_time = datetime.now(self.timezone)
-                    embed = discord.Embed(
-                        title="Role Assigned",
-                        description=f"Role {role.mention} was assigned to {member.mention}.",
-                        color=discord.Color.green(),
-                        timestamp=join_time
-                    )
-                    embed.add_field(name="Username", value=member.name, inline=False)
-                    embed.add_field(name="User ID", value=member.id, inline=False)
-                    embed.add_field(name="Role Assigned", value=role.name, inline=False)
-
-                    logs_channel_id = int(self.config["LOGS_CHANNEL_ID"])  # Get the logs channel ID
-                    logs_channel = self.bot.get_channel(logs_channel_id)
-                    if logs_channel:
-                        await logs_channel.send(embed=embed)
-                    else:
-                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Logs channel with ID {logs_channel_id} not found.")
-                except discord.Forbidden:
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Missing permissions to add role to {member.name}")
-                except Exception as e:
-                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Error adding role to {member.name}: {e}")
+            # Only reads the member cache, the role worker makes the API calls
+            for member in guild.members:
+                self.role_worker.track(member, "reconcile")
+
+            if self.role_worker.missing:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) {len(self.role_worker.missing)} members are waiting for {role.name}.")
 
         except Exception as e:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Error in check_missing_roles: {e}")
 
+    @check_missing_roles.before_loop
+    async def before_check_missing_roles(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(minutes=1)
+    async def prune_flood_detector(self):
+        # Forget users and channels that have gone quiet so the counters don't grow forever
+        self.flood_detector.prune(time.monotonic())
+
+    @tasks.loop(seconds=10)
+    async def flush_chat_logs(self):
+        # Write batched chat log changes to disk
+        await self.chat_logs.flush_async()
+
+    @tasks.loop(hours=24)
+    async def compact_chat_logs(self):
+        # Apply the retention policy to the chat logs off the message path
+        try:
+            archived, expired = await self.chat_logs.compact(self.chat_log_hot_days, self.chat_log_expire_days or None)
+            if self.chat_log_expire_days:
+                cutoff = datetime.now(self.timezone) - timedelta(days=self.chat_log_expire_days)
+                self.message_archive.expire_before(cutoff.strftime('%Y-%m-%d %H:%M:%S'))
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Chat log compaction archived {archived} and expired {expired} messages.")
+        except Exception as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) Error in compact_chat_logs: {e}")
+
+    @compact_chat_logs.before_loop
+    async def before_compact_chat_logs(self):
+        await self.bot.wait_until_ready()
+
     async def cog_load(self):
+        self.role_worker.start()
         self.check_missing_roles.start()
+        self.prune_flood_detector.start()
+        self.flush_chat_logs.start()
+        self.compact_chat_logs.start()
+        await self.restore_flood_locks()
+
+    async def cog_unload(self):
+        self.check_missing_roles.cancel()
+        self.prune_flood_detector.cancel()
+        if self.raid_task:
+            self.raid_task.cancel()
+        self.role_worker.stop()
+        self.flush_chat_logs.cancel()
+        self.compact_chat_logs.cancel()
+        # Cancelling a lock lifts it, wait for that before the cog goes away
+        lock_tasks = list(self.flood_lock_tasks.values())
+        for task in lock_tasks:
+            task.cancel()
+        await asyncio.gather(*lock_tasks, return_exceptions=True)
+        await self.chat_logs.flush_async()
+        await self.log_sender.flush()
+
+class RaidActionView(discord.ui.View):
+    def __init__(self, member_ids):
+        super().__init__(timeout=None)
+        self.member_ids = member_ids
+
+    async def finish(self, interaction, button, action, done, failed):
+        button.label = f"{action} {done}"
+        for child in self.children:
+            child.disabled = True
+        await interaction.message.edit(view=self)
+        await interaction.followup.send(f"{action} {done} members" + (f", {failed} failed." if failed else "."), ephemeral=True)
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (moderationevents.py) {interaction.user.name} {action.lower()} {done} raid members, {failed} failed.")
+
+    @discord.ui.button(label="Kick All", style=discord.ButtonStyle.danger)
+    async def kick_button(self, interaction, button):
+        if not interaction.user.guild_permissions.kick_members:
+            await interaction.response.send_message("You need the Kick Members permission to do that.", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        done = failed = 0
+        for member_id in self.member_ids:
+            member = interaction.guild.get_member(member_id)
+            if member is None:
+                continue  # Already gone
+            try:
+                await member.kick(reason=f"Raid cleanup by {interaction.user.name}")
+                done += 1
+            except discord.HTTPException:
+                failed += 1
+        await self.finish(interaction, button, "Kicked", done, failed)
+
+    @discord.ui.button(label="Ban All", style=discord.ButtonStyle.danger)
+    async def ban_button(self, interaction, button):
+        if not interaction.user.guild_permissions.ban_members:
+            await interaction.response.send_message("You need the Ban Members permission to do that.", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True, thinking=True)
+
+        # Bans members who already left too, 200 per request with the bulk ban endpoint
+        done = failed = 0
+        for start in range(0, len(self.member_ids), 200):
+            users = [discord.Object(id=member_id) for member_id in self.member_ids[start:start + 200]]
+            try:
+                result = await interaction.guild.bulk_ban(users, reason=f"Raid cleanup by {interaction.user.name}", delete_message_seconds=3600)
+                done += len(result.banned)
+                failed += len(result.failed)
+            except discord.HTTPException:
+                failed += len(users)
+        await self.finish(interaction, button, "Banned", done, failed)
 
 async def setup(bot):
     await bot.add_cog(ModerationEvents(bot))
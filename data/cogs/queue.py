@@ -1,26 +1,33 @@
 import discord
 from discord.ext import commands
-import sqlite3
 import os
 import json
 import asyncio
 from datetime import datetime
+from utils.queueengine import CoalescedRefresh
 
 class QueueSystem(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.data_dir = "queue_files"
-        self.db_path = os.path.join(self.data_dir, "queue_system.db")
+        self.queue_engine = bot.queue_engine
+        self.data_dir = self.queue_engine.data_dir
         self.message_id_file = os.path.join(self.data_dir, "queue_message_id.txt")
+        self.channel_id = None
+        self.message_id = None
+        self.queue_message = None  # Partial message handle, resolved once instead of fetched for every update
 
-        # Ensure data directory exists
-        os.makedirs(self.data_dir, exist_ok=True)
+        # Re-render the queue message when the queue changes instead of polling it
+        self.refresh = CoalescedRefresh(self.update_queue_message)
+        self.queue_engine.add_listener(self.refresh.request)
 
-        self.init_database()
         self.load_secrets()
         self.bot.loop.create_task(self.setup_queue_message())
         self.user_response_messages = {}  # Track user response messages for editing
 
+    async def cog_unload(self):
+        self.queue_engine.remove_listener(self.refresh.request)
+        self.refresh.cancel()
+
     def load_secrets(self):
         """Load secrets from JSON file"""
         try:
@@ -30,36 +37,13 @@ class QueueSystem(commands.Cog):
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Secrets file not found!")
             self.secrets = {}
 
-    def init_database(self):
-        """Initialize the SQLite database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS queue_users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            is_subscriber BOOLEAN,
-            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-        conn.commit()
-        conn.close()
-
     async def get_queue_count(self):
         """Get the current queue count"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM queue_users")
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        return self.queue_engine.count()
 
     async def get_user_position(self, user_id):
         """Get the user's position in the queue"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM queue_users WHERE joined_at <= (SELECT joined_at FROM queue_users WHERE user_id = ?)", (user_id,))
-        position = cursor.fetchone()[0]
-        conn.close()
-        return position
+        return self.queue_engine.position(user_id)
 
     async def is_user_twitch_sub(self, user_id, guild):
         """Check if user has the Twitch subscriber role"""
@@ -78,46 +62,20 @@ class QueueSystem(commands.Cog):
 
         return twitch_sub_role_id in [role.id for role in member.roles]
 
-    async def periodic_queue_update(self, channel_id):
-        """Periodically update the queue message with current count"""
-        last_count = -1
-        last_queue_disabled_status = None
-
-        while True:
-            try:
-                current_count = await self.get_queue_count()
-                queue_disabled_current_status = os.path.exists(os.path.join(self.data_dir, "disablequeue"))
-
-                # Only attempt to update if count changed
-                if current_count != last_count or last_queue_disabled_status != queue_disabled_current_status:
-                    message_id = await self.load_message_id()
-                    if message_id:
-                        await self.update_queue_message(channel_id, message_id, queue_disabled_current_status)
-                        last_count = current_count
-                        last_queue_disabled_status = queue_disabled_current_status
-
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error updating queue: {e}")
-                continue
-
-            await asyncio.sleep(5)
-
-    async def update_queue_message(self, channel_id, message_id, queue_disabled=False):
+    async def update_queue_message(self):
         """Update the queue message with current count"""
-        try:
-            channel = self.bot.get_channel(channel_id)
-            if not channel:
-                return
+        message = self.queue_message
+        if message is None:
+            return
 
-            message = await channel.fetch_message(message_id)
+        try:
+            queue_disabled = self.queue_engine.disabled
 
             # Get current queue count
             count = await self.get_queue_count()
 
             # Update embed with new count or disabled message
-            embed = message.embeds[0] if message.embeds else discord.Embed()
+            embed = discord.Embed()
 
             if queue_disabled:
                 embed.title = "Game Queue - DISABLED"
@@ -129,8 +87,8 @@ class QueueSystem(commands.Cog):
                 embed.color = discord.Color.blue()
 
             # Update view with button state
-            view = QueueView(self, channel_id)
-            view.message_id = message_id
+            view = QueueView(self, self.channel_id)
+            view.message_id = message.id
 
             # Disable buttons if queue is disabled
             if queue_disabled:
@@ -152,9 +110,30 @@ class QueueSystem(commands.Cog):
                             child.style = discord.ButtonStyle.danger
 
             await message.edit(embed=embed, view=view)
+        except discord.NotFound:
+            # Only recover once, even if the delete event got here first
+            if self.queue_message is message:
+                await self.recover_queue_message()
         except Exception as e:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error updating queue message: {e}")
 
+    async def recover_queue_message(self):
+        """Forget the queue message after it was deleted and post a new one"""
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Queue message {self.message_id} was deleted, creating a new one")
+        self.queue_message = None
+        await self.save_message_id(None)
+
+        channel = self.bot.get_channel(self.channel_id)
+        if channel:
+            try:
+                await self.create_new_queue_message(channel, self.channel_id)
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error creating new queue message: {e}")
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        if self.queue_message is not None and payload.message_id == self.message_id:
+            await self.recover_queue_message()
 
     async def setup_queue_message(self):
         """Set up the queue message on bot startup"""
@@ -176,53 +155,31 @@ class QueueSystem(commands.Cog):
         if not channel:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Channel with ID {channel_id} not found!")
             return
+        self.channel_id = channel_id
 
-        # Try to load existing message ID first
-        message_id = await self.load_message_id()
-        if message_id:
-            try:
-                # Try to fetch the existing message
-                message = await channel.fetch_message(message_id)
-                # If we get here, the message exists, so just set up the periodic updates
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Found existing queue message {message_id}")
-
-                # Update the view to ensure buttons are properly set
-                view = QueueView(self, channel_id)
-                view.message_id = message_id
-
-                # Update the message to ensure it has the correct view
-                await self.update_queue_message(channel_id, message_id)
-
-                # Start periodic updates
-                self.bot.loop.create_task(self.periodic_queue_update(channel_id))
-                return
-            except discord.NotFound:
-                # Message doesn't exist, create a new one
-                pass
-            except discord.Forbidden:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No permission to fetch queue message")
-                return
-
-        # Delete any existing queue message first (if we're creating a new one)
-        await self.delete_existing_queue_message(channel)
+        # Load the stored message ID once, after this it is only kept in memory
+        self.message_id = await self.load_message_id()
+        if self.message_id:
+            # Editing the stored message brings it up to date, and posts a new one if it was deleted
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Found existing queue message {self.message_id}")
+            self.queue_message = channel.get_partial_message(self.message_id)
+            await self.update_queue_message()
+            return
 
         # Create new queue message
         await self.create_new_queue_message(channel, channel_id)
 
-        # Start periodic updates
-        self.bot.loop.create_task(self.periodic_queue_update(channel_id))
-
-
     async def delete_existing_queue_message(self, channel):
         """Delete any existing queue message in the channel"""
         try:
-            # Read the stored message ID
-            message_id = await self.load_message_id()
+            message_id = self.message_id
             if message_id:
+                # Clear the stored message first, so the delete isn't treated as the message going missing
+                self.queue_message = None
+                await self.save_message_id(None)
                 try:
                     # Try to delete the old message
-                    old_message = await channel.fetch_message(message_id)
-                    await old_message.delete()
+                    await channel.get_partial_message(message_id).delete()
                     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Deleted old queue message {message_id}")
                 except discord.NotFound:
                     # Message doesn't exist, that's fine
@@ -230,8 +187,6 @@ class QueueSystem(commands.Cog):
                 except discord.Forbidden:
                     # No permission to delete, that's fine
                     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No permission to delete old queue message")
-                # Clear the stored message ID
-                await self.save_message_id(None)
         except Exception as e:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error deleting existing queue message: {e}")
 
@@ -247,7 +202,10 @@ class QueueSystem(commands.Cog):
         return None
 
     async def save_message_id(self, message_id):
-        """Save the message ID to file"""
+        """Keep the message ID, writing it to file only when it changes"""
+        if message_id == self.message_id and os.path.exists(self.message_id_file):
+            return
+        self.message_id = message_id
         try:
             with open(self.message_id_file, 'w') as f:
                 f.write(str(message_id) if message_id else "")
@@ -267,13 +225,15 @@ class QueueSystem(commands.Cog):
         view = QueueView(self, channel_id)
         message = await channel.send(embed=embed, view=view)
 
-        # Store the message ID for later updates
+        # Keep a handle on the message for later updates
         view.message_id = message.id
         await self.save_message_id(message.id)
+        self.channel_id = channel_id
+        self.queue_message = channel.get_partial_message(message.id)
         print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] New queue message created with ID {message.id}")
 
         # Update the message to show current count
-        await self.update_queue_message(channel_id, message.id)
+        await self.update_queue_message()
 
     @commands.command(name="createqueue")
     async def create_queue(self, ctx):
@@ -300,6 +260,11 @@ class QueueSystem(commands.Cog):
         await self.create_new_queue_message(channel, channel_id)
         await ctx.send(f"Queue created in <#{channel_id}>")
 
+    @commands.command(name="queuestats")
+    async def queue_stats(self, ctx):
+        """Show how long queue database writes are waiting and taking"""
+        await ctx.send(f"{self.queue_engine.count()} players in the queue.\n{self.queue_engine.db.status_text()}")
+
 class QueueView(discord.ui.View):
     def __init__(self, cog, channel_id):
         super().__init__(timeout=None)
@@ -342,40 +307,29 @@ class QueueView(discord.ui.View):
         guild = interaction.guild
 
         # Check if user is already in queue
-        conn = sqlite3.connect(self.cog.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM queue_users WHERE user_id=?", (user_id,))
-        existing_user = cursor.fetchone()
-
-        if existing_user:
+        if user_id in self.cog.queue_engine:
             message = await interaction.followup.send(
                 "You're already in the queue!",
                 ephemeral=True
             )
             asyncio.create_task(self.delete_message_after_delay(message, 10))
-            conn.close()
             return
 
         try:
             # Check if user is a Twitch subscriber
             is_subscriber = await self.cog.is_user_twitch_sub(user_id, guild)
 
-            # Add user to queue
-            cursor.execute(
-                "INSERT INTO queue_users (user_id, username, is_subscriber) VALUES (?, ?, ?)",
-                (user_id, username, is_subscriber)
-            )
-            conn.commit()
-            conn.close()
+            # Add user to queue, another press may have added them while checking the subscription
+            if await self.cog.queue_engine.join(user_id, username, is_subscriber):
+                response = "You've been added to the queue!"
+            else:
+                response = "You're already in the queue!"
 
             message = await interaction.followup.send(
-                "You've been added to the queue!",
+                response,
                 ephemeral=True
             )
             asyncio.create_task(self.delete_message_after_delay(message, 10))
-
-            # Update queue message
-            await self.cog.update_queue_message(self.channel_id, self.message_id)
         except:
             message = await interaction.followup.send(
                 "An error occurred while attempting to join the queue, please try joining again.",
@@ -397,13 +351,7 @@ class QueueView(discord.ui.View):
         user_id = interaction.user.id
 
         # Check if user is actually in the queue before showing confirmation
-        conn = sqlite3.connect(self.cog.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM queue_users WHERE user_id=?", (user_id,))
-        existing_user = cursor.fetchone()
-        conn.close()
-
-        if not existing_user:
+        if user_id not in self.cog.queue_engine:
             await self.send_user_response(
                 interaction,
                 "You are not currently in the queue!",
@@ -473,11 +421,7 @@ class ConfirmView(discord.ui.View):
     async def confirm_leave(self, interaction, button):
         """Confirm leaving the queue"""
         # Remove user from queue
-        conn = sqlite3.connect(self.cog.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM queue_users WHERE user_id=?", (self.user_id,))
-        conn.commit()
-        conn.close()
+        await self.cog.queue_engine.remove(self.user_id)
 
         # Update the response embed to show success
         try:
@@ -487,9 +431,6 @@ class ConfirmView(discord.ui.View):
                 color=discord.Color.green()
             )
             await interaction.response.edit_message(embed=success_embed, view=None, delete_after=5.0)
-
-            # Update the main queue message
-            await self.cog.update_queue_message(self.channel_id, self.message_id)
         except:
             await interaction.response.edit_message(content="Successfully left the queue.", view=None, delete_after=5.0)
 
@@ -1,25 +1,31 @@
 import discord
 from discord.ext import commands
-import sqlite3
 import os
 import json
-import asyncio
 from datetime import datetime
+from utils.queueengine import CoalescedRefresh
 
 class QueueMaster(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-        self.queue_dir = "queue_files"
-        if not os.path.exists(self.queue_dir):
-            os.makedirs(self.queue_dir)
-
-        self.db_path = os.path.join(self.queue_dir, "queue_system.db")
+        self.queue_engine = bot.queue_engine
+        self.queue_dir = self.queue_engine.data_dir
         self.message_id_file = os.path.join(self.queue_dir, "queue_puller_message_id.txt")
-        self.init_database()
+        self.channel_id = None
+        self.message_id = None
+        self.puller_message = None  # Partial message handle, resolved once instead of fetched for every update
+
+        # Re-render the puller message when the queue changes instead of polling it
+        self.refresh = CoalescedRefresh(self.update_puller_message)
+        self.queue_engine.add_listener(self.refresh.request)
+
         self.load_secrets()
         self.bot.loop.create_task(self.setup_puller_message())
-        self.bot.loop.create_task(self.refresh_queue_loop())
+
+    async def cog_unload(self):
+        self.queue_engine.remove_listener(self.refresh.request)
+        self.refresh.cancel()
 
     def load_secrets(self):
         """Load secrets from JSON file"""
@@ -30,121 +36,54 @@ class QueueMaster(commands.Cog):
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Secrets file not found!")
             self.secrets = {}
 
-    def init_database(self):
-        """Initialize the SQLite database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS queue_users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            is_subscriber BOOLEAN,
-            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-        conn.commit()
-        conn.close()
-
     async def get_queue_count(self):
         """Get the current queue count"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM queue_users")
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        return self.queue_engine.count()
 
     async def get_queue_users(self):
         """Get all users in queue ordered by join time"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, username, is_subscriber FROM queue_users ORDER BY joined_at ASC")
-        users = cursor.fetchall()
-        conn.close()
-        return users
+        return self.queue_engine.users()
 
     async def get_user_position(self, user_id):
         """Get the user's position in the queue"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM queue_users WHERE joined_at <= (SELECT joined_at FROM queue_users WHERE user_id = ?)", (user_id,))
-        position = cursor.fetchone()[0]
-        conn.close()
-        return position
+        return self.queue_engine.position(user_id)
 
     async def pull_top_user(self):
         """Pull the user at the top of the queue"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, username FROM queue_users ORDER BY joined_at ASC LIMIT 1")
-        user = cursor.fetchone()
-        if user:
-            user_id, username = user
-            cursor.execute("DELETE FROM queue_users WHERE user_id=?", (user_id,))
-            conn.commit()
-            conn.close()
-            return user_id, username
-        conn.close()
-        return None, None
+        return await self.queue_engine.pull_top()
 
     async def pull_top_subscriber(self):
         """Pull the user at the top of the subscriber queue"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id, username FROM queue_users WHERE is_subscriber=1 ORDER BY joined_at ASC LIMIT 1")
-        user = cursor.fetchone()
-        if user:
-            user_id, username = user
-            cursor.execute("DELETE FROM queue_users WHERE user_id=?", (user_id,))
-            conn.commit()
-            conn.close()
-            return user_id, username
-        conn.close()
-        return None, None
+        return await self.queue_engine.pull_top(subscriber=True)
 
     async def remove_user_from_queue(self, user_id):
         """Remove a specific user from the queue"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM queue_users WHERE user_id=?", (user_id,))
-        conn.commit()
-        conn.close()
+        await self.queue_engine.remove(user_id)
 
     def is_queue_disabled(self):
         """Check if queue is disabled"""
-        disable_file = os.path.join(self.queue_dir, "disablequeue")
-        return os.path.exists(disable_file)
+        return self.queue_engine.disabled
 
     async def toggle_queue_status(self):
         """Toggle queue status (disable/enable)"""
-        disable_file = os.path.join(self.queue_dir, "disablequeue")
-
-        if self.is_queue_disabled():
-            # Enable queue - remove disable file
-            if os.path.exists(disable_file):
-                os.remove(disable_file)
-            return False  # Queue is enabled
-        else:
-            # Disable queue - create disable file
-            with open(disable_file, 'w') as f:
-                f.write("Queue disabled")
-            return True  # Queue is disabled
+        self.queue_engine.set_disabled(not self.queue_engine.disabled)
+        return self.queue_engine.disabled
 
-    async def update_puller_message(self, channel_id, message_id):
+    async def update_puller_message(self):
         """Update the puller message with current queue list"""
-        try:
-            channel = self.bot.get_channel(channel_id)
-            if not channel:
-                return
+        message = self.puller_message
+        if message is None:
+            return
 
-            message = await channel.fetch_message(message_id)
+        try:
             users = await self.get_queue_users()
 
-            # Create or update embed with queue list
-            embed = message.embeds[0] if message.embeds else discord.Embed()
-            embed.title = "Queue Master"
-            embed.description = "Select an action below"
-
-            # Clear existing queue fields if they exist
-            embed.clear_fields()
+            # Create embed with queue list
+            embed = discord.Embed(
+                title="Queue Master",
+                description="Select an action below",
+                color=discord.Color.blue()
+            )
 
             all_users = []
             subscriber_users = []
@@ -170,8 +109,8 @@ class QueueMaster(commands.Cog):
                 embed.add_field(name="Subscriber Queue", value="No subscribers in queue", inline=True)
 
             # Create the view with correct button state
-            view = MasterView(self, channel_id)
-            view.message_id = message_id
+            view = MasterView(self, self.channel_id)
+            view.message_id = message.id
 
             # Set the correct button label based on current queue status
             if self.is_queue_disabled():
@@ -182,9 +121,31 @@ class QueueMaster(commands.Cog):
                 view.toggle_queue_button.style = discord.ButtonStyle.danger
 
             await message.edit(embed=embed, view=view)
+        except discord.NotFound:
+            # Only recover once, even if the delete event got here first
+            if self.puller_message is message:
+                await self.recover_puller_message()
         except Exception as e:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error updating puller message: {e}")
 
+    async def recover_puller_message(self):
+        """Forget the puller message after it was deleted and post a new one"""
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Puller message {self.message_id} was deleted, creating a new one")
+        self.puller_message = None
+        self.save_message_id(None)
+
+        channel = self.bot.get_channel(self.channel_id)
+        if channel:
+            try:
+                await self.create_new_puller_message(channel, self.channel_id)
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error creating new puller message: {e}")
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        if self.puller_message is not None and payload.message_id == self.message_id:
+            await self.recover_puller_message()
+
     async def setup_puller_message(self):
         """Set up the puller message on bot startup"""
         await self.bot.wait_until_ready()
@@ -205,46 +166,31 @@ class QueueMaster(commands.Cog):
         if not channel:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Channel with ID {channel_id} not found!")
             return
+        self.channel_id = channel_id
 
-        # Try to load existing message ID first
-        message_id = self.load_message_id()
-        if message_id:
-            try:
-                # Try to fetch the existing message
-                message = await channel.fetch_message(message_id)
-                # If we get here, the message exists, so just set up the periodic updates
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Found existing puller message {message_id}")
-
-                # Update the view to ensure buttons are properly set
-                view = MasterView(self, channel_id)
-                view.message_id = message_id
-
-                # Update the message to ensure it has the correct view
-                await self.update_puller_message(channel_id, message_id)
-
-                # Start periodic updates
-                self.bot.loop.create_task(self.refresh_queue_loop())
-                return
-            except discord.NotFound:
-                # Message doesn't exist, create a new one
-                pass
-            except discord.Forbidden:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No permission to fetch puller message")
-                return
-
-        # Create new puller message if no valid existing message
+        # Load the stored message ID once, after this it is only kept in memory
+        self.message_id = self.load_message_id()
+        if self.message_id:
+            # Editing the stored message brings it up to date, and posts a new one if it was deleted
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Found existing puller message {self.message_id}")
+            self.puller_message = channel.get_partial_message(self.message_id)
+            await self.update_puller_message()
+            return
+
+        # Create new puller message if no existing message
         await self.create_new_puller_message(channel, channel_id)
 
     async def delete_existing_puller_message(self, channel):
         """Delete any existing puller message in the channel"""
         try:
-            # Read the stored message ID
-            message_id = self.load_message_id()
+            message_id = self.message_id
             if message_id:
+                # Clear the stored message first, so the delete isn't treated as the message going missing
+                self.puller_message = None
+                self.save_message_id(None)
                 try:
                     # Try to delete the old message
-                    old_message = await channel.fetch_message(message_id)
-                    await old_message.delete()
+                    await channel.get_partial_message(message_id).delete()
                     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Deleted old puller message {message_id}")
                 except discord.NotFound:
                     # Message doesn't exist, that's fine
@@ -252,8 +198,6 @@ class QueueMaster(commands.Cog):
                 except discord.Forbidden:
                     # No permission to delete, that's fine
                     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] No permission to delete old puller message")
-                # Clear the stored message ID
-                self.save_message_id(None)
         except Exception as e:
             print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error deleting existing puller message: {e}")
 
@@ -269,7 +213,10 @@ class QueueMaster(commands.Cog):
         return None
 
     def save_message_id(self, message_id):
-        """Save the message ID to file"""
+        """Keep the message ID, writing it to file only when it changes"""
+        if message_id == self.message_id and os.path.exists(self.message_id_file):
+            return
+        self.message_id = message_id
         try:
             with open(self.message_id_file, 'w') as f:
                 f.write(str(message_id) if message_id else "")
@@ -293,35 +240,15 @@ class QueueMaster(commands.Cog):
         view = MasterView(self, channel_id)
         message = await channel.send(embed=embed, view=view)
 
-        # Store the message ID for later updates
+        # Keep a handle on the message for later updates
         view.message_id = message.id
         self.save_message_id(message.id)
+        self.channel_id = channel_id
+        self.puller_message = channel.get_partial_message(message.id)
         print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] New puller message created with ID {message.id}")
 
-    async def refresh_queue_loop(self):
-        """Refresh queue every 5 seconds"""
-        await self.bot.wait_until_ready()
-        await asyncio.sleep(5)
-
-        last_count = -1
-
-        while True:
-            try:
-                current_count = await self.get_queue_count()
-
-                if current_count != last_count:
-                    # Get channel ID from secrets
-                    channel_id = int(self.secrets.get("QUEUE_MASTER_CHANNEL_ID"))
-
-                    message_id = self.load_message_id()
-                    if message_id:
-                        await self.update_puller_message(channel_id, message_id)
-                        last_count = current_count
-
-            except Exception as e:
-                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Error in refresh loop: {e}")
-
-            await asyncio.sleep(5)
+        # Update the message to show the current queue
+        await self.update_puller_message()
 
 class MasterView(discord.ui.View):
     def __init__(self, cog, channel_id):
@@ -350,8 +277,6 @@ class MasterView(discord.ui.View):
                 f"Picked `{username}` from the queue!",
                 ephemeral=True
             )
-
-            await self.cog.update_puller_message(self.channel_id, self.message_id)
         else:
             await interaction.followup.send("No users in queue.", ephemeral=True)
 
@@ -373,8 +298,6 @@ class MasterView(discord.ui.View):
                 f"Picked subscriber `{username}` from the queue!",
                 ephemeral=True
             )
-
-            await self.cog.update_puller_message(self.channel_id, self.message_id)
         else:
             await interaction.followup.send("No subscribers in queue.", ephemeral=True)
 
@@ -464,15 +387,8 @@ class ConfirmClearView(discord.ui.View):
                 except:
                     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Failed to send DM to user '{username}'")
         
-        # Clear the database
-        conn = sqlite3.connect(self.cog.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM queue_users")
-        conn.commit()
-        conn.close()
-
-        # Update the puller message
-        await self.cog.update_puller_message(self.channel_id, self.message_id)
+        # Clear the queue
+        await self.cog.queue_engine.clear()
 
         # Edit the original message instead of sending a new one
         await interaction.response.edit_message(
@@ -541,9 +457,6 @@ class UserSelectView(discord.ui.View):
                 view=None,
                 embed=None
             )
-
-            # Update puller message
-            await self.cog.update_puller_message(self.channel_id, self.message_id)
         else:
             await interaction.response.edit_message(
                 content="User not found!",
@@ -0,0 +1,253 @@
+import sqlite3
+import threading
+from datetime import datetime
+from utils.dbexecutor import DatabaseExecutor
+from utils.textdiff import apply_delta, make_delta, tokenize
+
+class MessageArchive:
+    """Indexed SQLite archive of every logged message.
+
+    The database runs in WAL mode so reads never wait on the writer. All writes are
+    queued on a DatabaseExecutor thread, which commits bursts in one transaction,
+    so logging a message from the event loop never touches the disk. Deleted
+    messages are kept and marked with `deleted_at`.
+
+    Message content is also indexed in an FTS5 table kept in sync by triggers, so
+    full-text searches never scan the messages table.
+
+    Every edit keeps the previous version in `message_revisions` as a delta that turns
+    the newer content back into the older one, so only the latest version is stored in full.
+    """
+    def __init__(self, db_path, batch_size=500):
+        self.db_path = db_path
+        self.fts_enabled = False
+
+        self.init_database()
+
+        # Reads come from the event loop and worker threads, so share one connection behind a lock
+        self.read_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.read_conn.row_factory = sqlite3.Row
+        self.read_lock = threading.Lock()
+
+        self.db = DatabaseExecutor(self.db_path, name="message-archive-writer", batch_size=batch_size)
+
+    def init_database(self):
+        """Initialize the SQLite database"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute('''CREATE TABLE IF NOT EXISTS messages (
+            message_id INTEGER PRIMARY KEY,
+            channel_id INTEGER NOT NULL,
+            channel_name TEXT,
+            author_id INTEGER NOT NULL,
+            author_name TEXT,
+            content TEXT,
+            created_at TEXT NOT NULL,
+            edited_at TEXT,
+            deleted_at TEXT,
+            jump_url TEXT
+        )''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages (channel_id, message_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_author ON messages (author_id, created_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_created ON messages (created_at)")
+        # Revision N holds the delta from version N back to version N-1, version 0 being the original message
+        cursor.execute('''CREATE TABLE IF NOT EXISTS message_revisions (
+            message_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            edited_at TEXT,
+            delta TEXT NOT NULL,
+            PRIMARY KEY (message_id, revision)
+        )''')
+        conn.commit()
+
+        try:
+            self.init_search_index(cursor)
+            conn.commit()
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (archive.py) Full-text search unavailable, searches will scan the archive: {e}")
+        conn.close()
+
+    def init_search_index(self, cursor):
+        """Create the FTS5 index over message content and the triggers that keep it up to date"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='messages_fts'")
+        index_exists = cursor.fetchone() is not None
+
+        cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='message_id')")
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.message_id, new.content);
+        END''')
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.message_id, old.content);
+        END''')
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.message_id, old.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (new.message_id, new.content);
+        END''')
+
+        if not index_exists:
+            # Archive created before the search index existed, index what is already there
+            cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+    def write_records(self, channel_id, records):
+        """Queue chat log records (see ChatLogStore) to be written by the database thread"""
+        if records:
+            channel_id = str(channel_id)
+            self.db.submit(lambda conn: self.apply_records(conn, channel_id, records)).add_done_callback(self.report_write_error)
+
+    def apply_records(self, conn, channel_id, records):
+        for record in records:
+            self.apply_record(conn, channel_id, record)
+
+    def report_write_error(self, future):
+        error = future.exception()
+        if error is not None:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (archive.py) Error writing to the message archive: {error}")
+
+    def apply_record(self, conn, channel_id, record):
+        op = record.get("op")
+        if op == "expire":
+            conn.execute("DELETE FROM message_revisions WHERE message_id IN (SELECT message_id FROM messages WHERE created_at < ?)", (record["before"],))
+            conn.execute("DELETE FROM messages WHERE created_at < ?", (record["before"],))
+            return
+
+        message_id = int(record["id"])
+        if op == "put":
+            data = record["data"]
+            self.add_revision(conn, message_id, data.get("content"), data.get("edited_at"))
+            conn.execute('''INSERT INTO messages (message_id, channel_id, channel_name, author_id, author_name, content, created_at, edited_at, jump_url)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(message_id) DO UPDATE SET
+                    channel_name=excluded.channel_name,
+                    author_name=excluded.author_name,
+                    content=excluded.content,
+                    edited_at=COALESCE(excluded.edited_at, messages.edited_at),
+                    jump_url=excluded.jump_url''',
+                (message_id, int(channel_id), data.get("channel_name"), int(data["author_id"]), data.get("author_name"),
+                 data.get("content"), data["created_at"], data.get("edited_at"), data.get("jump_url")))
+        elif op == "edit":
+            self.add_revision(conn, message_id, record["content"], record["edited_at"])
+            conn.execute("UPDATE messages SET content=?, edited_at=? WHERE message_id=?", (record["content"], record["edited_at"], message_id))
+        elif op == "delete":
+            deleted_at = record.get("deleted_at") or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            conn.execute("UPDATE messages SET deleted_at=? WHERE message_id=?", (deleted_at, message_id))
+
+    def add_revision(self, conn, message_id, new_content, edited_at):
+        """Store the current content of a message as a delta before it is replaced"""
+        row = conn.execute("SELECT content FROM messages WHERE message_id=?", (message_id,)).fetchone()
+        if row is None or row[0] is None or new_content is None or row[0] == new_content:
+            return
+
+        revision = conn.execute("SELECT COALESCE(MAX(revision), 0) + 1 FROM message_revisions WHERE message_id=?", (message_id,)).fetchone()[0]
+        conn.execute("INSERT INTO message_revisions (message_id, revision, edited_at, delta) VALUES (?, ?, ?, ?)",
+                     (message_id, revision, edited_at, make_delta(new_content, row[0])))
+
+    def get_versions(self, message_id, oldest=0, newest=None):
+        """Rebuild a message's versions from `oldest` up to `newest`, or the current one.
+
+        Returns a list of (version, timestamp, content) tuples, oldest first, or None if the
+        message isn't archived. Only the deltas newer than `oldest` are read, they are applied
+        to one token list, and only the versions in range are joined back into text.
+        """
+        message = self.get_message(message_id)
+        if message is None:
+            return None
+
+        revisions = self.query("SELECT revision, edited_at, delta FROM message_revisions WHERE message_id=? AND revision>=? ORDER BY revision DESC",
+                               (int(message_id), max(oldest, 1)))
+
+        tokens = tokenize(message["content"] or "")
+        versions = []
+        for revision in revisions:
+            if newest is None or revision["revision"] <= newest:
+                versions.append((revision["revision"], revision["edited_at"], "".join(tokens)))
+            if revision["revision"] == oldest:
+                break
+            apply_delta(tokens, revision["delta"])
+        if oldest == 0:
+            versions.append((0, message["created_at"], "".join(tokens)))
+        versions.reverse()
+        return versions
+
+    def count_revisions(self, message_id):
+        return self.query("SELECT COUNT(*) AS total FROM message_revisions WHERE message_id=?", (int(message_id),))[0]["total"]
+
+    def ingest_channel(self, channel_id, message_log):
+        """Queue a whole channel log (message ID -> message data) for import"""
+        self.write_records(channel_id, [{"op": "put", "id": message_id, "data": message_data} for message_id, message_data in message_log.items()])
+
+    def expire_before(self, created_at):
+        """Queue deleting every message created before a 'YYYY-MM-DD HH:MM:SS' timestamp"""
+        self.write_records("0", [{"op": "expire", "before": created_at}])
+
+    def query(self, sql, params=()):
+        with self.read_lock:
+            return [dict(row) for row in self.read_conn.execute(sql, params).fetchall()]
+
+    def get_message(self, message_id):
+        rows = self.query("SELECT * FROM messages WHERE message_id=?", (int(message_id),))
+        return rows[0] if rows else None
+
+    def get_channel_messages(self, channel_id, limit=50):
+        """Get the channel's last `limit` messages, newest first"""
+        return self.query("SELECT * FROM messages WHERE channel_id=? ORDER BY message_id DESC LIMIT ?", (int(channel_id), limit))
+
+    def get_author_messages(self, author_id, since=None, limit=100, offset=0):
+        """Get an author's messages across all channels, including edited and deleted ones, newest first"""
+        # Served entirely by the (author_id, created_at) index, which also carries message_id as the rowid
+        return self.query("SELECT * FROM messages WHERE author_id=? AND created_at>=? ORDER BY created_at DESC, message_id DESC LIMIT ? OFFSET ?",
+                          (int(author_id), since or "", limit, offset))
+
+    def count_author_messages(self, author_id, since=None):
+        return self.query("SELECT COUNT(*) AS total FROM messages WHERE author_id=? AND created_at>=?", (int(author_id), since or ""))[0]["total"]
+
+    def get_messages_between(self, start, end, limit=1000):
+        """Get messages created between two 'YYYY-MM-DD HH:MM:SS' timestamps, oldest first"""
+        return self.query("SELECT * FROM messages WHERE created_at BETWEEN ? AND ? ORDER BY created_at ASC LIMIT ?", (start, end, limit))
+
+    def _search_clause(self, text, author_id=None, channel_id=None, start=None, end=None):
+        if self.fts_enabled:
+            # Quote the text so it is matched as a phrase instead of parsed as an FTS query
+            source = "messages_fts JOIN messages m ON m.message_id = messages_fts.rowid"
+            conditions = ["messages_fts MATCH ?"]
+            params = ['"' + text.replace('"', '""') + '"']
+        else:
+            source = "messages m"
+            conditions = ["m.content LIKE ?"]
+            params = [f"%{text}%"]
+
+        if author_id is not None:
+            conditions.append("m.author_id = ?")
+            params.append(int(author_id))
+        if channel_id is not None:
+            conditions.append("m.channel_id = ?")
+            params.append(int(channel_id))
+        if start is not None:
+            conditions.append("m.created_at >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("m.created_at <= ?")
+            params.append(end)
+
+        return f"FROM {source} WHERE " + " AND ".join(conditions), params
+
+    def search(self, text, author_id=None, channel_id=None, start=None, end=None, limit=10, offset=0):
+        """Search message content for a phrase, newest first.
+
+        `start` and `end` are 'YYYY-MM-DD HH:MM:SS' timestamps bounding when the message was created.
+        """
+        clause, params = self._search_clause(text, author_id, channel_id, start, end)
+        return self.query(f"SELECT m.* {clause} ORDER BY m.message_id DESC LIMIT ? OFFSET ?", params + [limit, offset])
+
+    def count_search(self, text, author_id=None, channel_id=None, start=None, end=None):
+        clause, params = self._search_clause(text, author_id, channel_id, start, end)
+        return self.query(f"SELECT COUNT(*) AS total {clause}", params)[0]["total"]
+
+    def pending_writes(self):
+        return self.db.jobs.qsize()
+
+    def close(self):
+        """Stop the database thread once everything queued has been written"""
+        self.db.close()
+        self.read_conn.close()
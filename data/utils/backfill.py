@@ -0,0 +1,96 @@
+import asyncio
+import time
+from datetime import datetime
+
+class BackfillJob:
+    """Background crawl of several channels' message history.
+
+    Up to `concurrency` channels are crawled at once by `backfill_channel`, a coroutine
+    called as `backfill_channel(channel, full, on_progress)` that reports each batch of
+    fetched messages through `on_progress(count)` and returns how many were logged.
+    Message history rate limits are bucketed per channel by Discord, so crawling a few
+    channels side by side stays within them while discord.py handles any 429s.
+    """
+    def __init__(self, channels, backfill_channel, full=False, concurrency=4, progress_interval=30):
+        self.channels = list(channels)
+        self.backfill_channel = backfill_channel
+        self.full = full
+        self.concurrency = max(1, concurrency)
+        self.progress_interval = progress_interval
+
+        self.channels_done = 0
+        self.messages_fetched = 0
+        self.messages_logged = 0
+        self.failed_channels = []
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def is_running(self):
+        return self.task is not None and not self.task.done()
+
+    def cancel(self):
+        if self.is_running():
+            self.task.cancel()
+
+    async def run(self):
+        self.started_at = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        reporter = asyncio.create_task(self.report_progress())
+
+        async def crawl(channel):
+            async with semaphore:
+                try:
+                    self.messages_logged += await self.backfill_channel(channel, self.full, self.add_fetched)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed_channels.append(channel)
+                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (backfill.py) Error processing channel {channel.name}: {e}")
+                self.channels_done += 1
+
+        try:
+            await asyncio.gather(*(crawl(channel) for channel in self.channels))
+        except asyncio.CancelledError:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (backfill.py) Backfill cancelled. {self.progress_text()}")
+            raise
+        finally:
+            self.finished_at = time.monotonic()
+            reporter.cancel()
+
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (backfill.py) Backfill complete. {self.progress_text()}")
+        return self.messages_logged
+
+    def add_fetched(self, count):
+        self.messages_fetched += count
+
+    async def report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (backfill.py) {self.progress_text()}")
+
+    def progress_text(self):
+        if self.started_at is None:
+            return "Backfill not started."
+
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        rate = self.messages_fetched / elapsed if elapsed > 0 else 0.0
+        text = (f"{self.channels_done}/{len(self.channels)} channels done, {self.messages_logged} messages logged, "
+                f"{self.messages_fetched} fetched at {rate:.1f} messages/s")
+
+        if self.finished_at is None:
+            # Channels differ wildly in size, so this is only a rough estimate from the channel rate
+            remaining = len(self.channels) - self.channels_done
+            if self.channels_done:
+                eta = elapsed / self.channels_done * remaining
+                text += f", ETA {int(eta // 60)}m {int(eta % 60)}s"
+            else:
+                text += ", ETA unknown"
+
+        if self.failed_channels:
+            text += f", {len(self.failed_channels)} channels failed"
+        return text
@@ -0,0 +1,666 @@
+import asyncio
+import gzip
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+DISCORD_EPOCH_MS = 1420070400000
+
+def snowflake_time(message_id):
+    """Get the UTC time a Discord ID was created"""
+    return datetime.fromtimestamp(((int(message_id) >> 22) + DISCORD_EPOCH_MS) / 1000, tz=timezone.utc)
+
+def time_snowflake(when):
+    """Get the smallest Discord ID that could have been created at `when`"""
+    return max(0, int(when.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22
+
+# Cached messages are packed into plain tuples of these fields. A tuple holding only strings
+# and None is untracked by the garbage collector, so a large cache adds nothing to GC passes
+PACKED_FIELDS = ("author_id", "author_name", "channel_id", "channel_name", "content", "created_at", "edited_at", "guild_id", "extra")
+PACKED_CONTENT = PACKED_FIELDS.index("content")
+PACKED_EDITED_AT = PACKED_FIELDS.index("edited_at")
+JUMP_URL_BASE = "https://discord.com/channels"
+MESSAGE_DATA_KEYS = frozenset(PACKED_FIELDS[:7] + ("jump_url",))
+
+def _intern(value):
+    return sys.intern(value) if value.__class__ is str else value
+
+def pack_message(message_id, data):
+    """Pack logged message data into a compact tuple.
+
+    Author and channel IDs and names are interned so every message from the same author
+    or channel shares one copy, and the jump URL is kept as just the guild ID since the
+    rest of it is the channel and message IDs. Anything that doesn't fit, like a jump URL
+    in another format, goes in a dict in the last field.
+    """
+    channel_id = _intern(data.get("channel_id"))
+    guild_id = None
+    extra = None
+
+    jump_url = data.get("jump_url")
+    if jump_url is not None:
+        parts = jump_url.rsplit("/", 3)
+        if len(parts) == 4 and parts[0] == JUMP_URL_BASE and parts[2] == channel_id and parts[3] == message_id:
+            guild_id = _intern(parts[1])
+        else:
+            extra = {"jump_url": jump_url}
+
+    if not data.keys() <= MESSAGE_DATA_KEYS:
+        extra = extra or {}
+        for key in data.keys() - MESSAGE_DATA_KEYS:
+            extra[key] = data[key]
+
+    return (_intern(data.get("author_id")), _intern(data.get("author_name")), channel_id, _intern(data.get("channel_name")),
+            data.get("content"), data.get("created_at"), data.get("edited_at"), guild_id, extra)
+
+def unpack_message(message_id, packed):
+    """Turn a tuple from pack_message back into the message data dict it was logged as"""
+    data = dict(zip(PACKED_FIELDS[:7], packed))
+    guild_id, extra = packed[7], packed[8]
+    data["jump_url"] = f"{JUMP_URL_BASE}/{guild_id}/{data['channel_id']}/{message_id}" if guild_id is not None else None
+    if extra:
+        data.update(extra)
+    return data
+
+def edit_packed_message(packed, content, edited_at):
+    edited = list(packed)
+    edited[PACKED_CONTENT] = content
+    edited[PACKED_EDITED_AT] = edited_at
+    return tuple(edited)
+
+
+class ChatLogStore:
+    """Append-only message log store.
+
+    Every channel gets a directory under `root_dir` holding newline-delimited JSON
+    segments. New messages, edits and deletes are appended as records instead of
+    rewriting the whole log, and a channel's log is rebuilt by replaying its segments
+    in order. Once the active segment grows past `segment_max_bytes` a new one is started.
+
+    Appends are written to the end of the active segment and fsynced, so each costs only
+    the size of the new records. A crash mid-write can only tear the last line: replays
+    skip a line that doesn't parse, and the next append starts on a fresh line.
+
+    `compact_channel` moves messages older than the hot window into gzip-compressed
+    monthly archives next to the segments (grouped by the month in the message ID)
+    and rewrites the remaining segments without dead records.
+    """
+    def __init__(self, root_dir="chat_logs", segment_max_bytes=256 * 1024):
+        self.root_dir = root_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.active_segments = {}  # channel_id -> path of the segment currently appended to
+        self.checked_legacy_logs = set()  # channel IDs already checked for a legacy JSON log
+        self.channel_locks = {}  # channel_id -> lock held while the channel's files are written or swapped
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def get_channel_dir(self, channel_id):
+        return os.path.join(self.root_dir, str(channel_id))
+
+    def get_legacy_log_file(self, channel_id):
+        return os.path.join(self.root_dir, f"message_log_{channel_id}.json")
+
+    def list_segments(self, channel_id):
+        """List the channel's segment files, oldest first"""
+        channel_dir = self.get_channel_dir(channel_id)
+        try:
+            names = os.listdir(channel_dir)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(channel_dir, name) for name in sorted(names) if name.startswith("segment_") and name.endswith(".ndjson")]
+
+    def channel_ids(self):
+        """Get every channel ID that has a log, including legacy JSON logs that haven't been imported yet"""
+        channel_ids = set()
+        for name in os.listdir(self.root_dir):
+            if name.isdigit() and os.path.isdir(os.path.join(self.root_dir, name)):
+                channel_ids.add(name)
+            elif name.startswith("message_log_") and name.endswith(".json"):
+                channel_ids.add(name[len("message_log_"):-len(".json")])
+        return channel_ids
+
+    def get_channel_lock(self, channel_id):
+        return self.channel_locks.setdefault(str(channel_id), threading.RLock())
+
+    def _new_segment_path(self, channel_id, segments):
+        index = 1
+        if segments:
+            index = int(os.path.basename(segments[-1])[len("segment_"):-len(".ndjson")]) + 1
+        return os.path.join(self.get_channel_dir(channel_id), f"segment_{index:08d}.ndjson")
+
+    def _get_active_segment(self, channel_id):
+        """Get the segment to append to, rolling over to a new one when it is full"""
+        path = self.active_segments.get(channel_id)
+        if path is None:
+            segments = self.list_segments(channel_id)
+            path = segments[-1] if segments else self._new_segment_path(channel_id, segments)
+
+        try:
+            if os.path.getsize(path) >= self.segment_max_bytes:
+                path = self._new_segment_path(channel_id, self.list_segments(channel_id))
+        except FileNotFoundError:
+            pass
+
+        self.active_segments[channel_id] = path
+        return path
+
+    def append(self, channel_id, records):
+        """Append records to the channel's active segment"""
+        if not records:
+            return
+
+        channel_id = str(channel_id)
+        with self.get_channel_lock(channel_id):
+            self.import_legacy_log(channel_id)
+            self._write_records(channel_id, records)
+
+    def _write_records(self, channel_id, records, chunk_size=1000):
+        os.makedirs(self.get_channel_dir(channel_id), exist_ok=True)
+
+        # Write in chunks so large batches still roll over into new segments
+        for start in range(0, len(records), chunk_size):
+            lines = "".join(json.dumps(record, separators=(',', ':')) + "\n" for record in records[start:start + chunk_size])
+            self._append(self._get_active_segment(channel_id), lines.encode('utf-8'))
+
+    def _append(self, path, data):
+        """Append to a segment and fsync it. A crash can only tear the last line, which iter_records skips"""
+        with open(path, 'a+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    # Finish off a line torn by a crash so the new records start on their own line
+                    data = b"\n" + data
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _atomic_write(self, path, data):
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def get_high_water_marks_file(self):
+        return os.path.join(self.root_dir, "high_water_marks.json")
+
+    def load_high_water_marks(self):
+        """Load the last logged message ID of every channel"""
+        try:
+            with open(self.get_high_water_marks_file(), 'r') as f:
+                return {channel_id: int(message_id) for channel_id, message_id in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+
+    def save_high_water_marks(self, high_water_marks):
+        self._atomic_write(self.get_high_water_marks_file(), json.dumps(high_water_marks, indent=4).encode('utf-8'))
+
+    def apply_record(self, message_log, record, packed=False, tombstones=None):
+        """Apply a single log record to a message log dict, holding messages as pack_message tuples if `packed` is set.
+
+        Every deleted ID is added to `tombstones` if it is given, since an archive can still
+        hold a copy of the message until the next compaction, either because it was never
+        in the hot log or because an edit brought it back into it.
+        """
+        op = record.get("op")
+        message_id = record.get("id")
+        if op == "put":
+            message_log[message_id] = pack_message(message_id, record["data"]) if packed else record["data"]
+        elif op == "edit":
+            message_data = message_log.get(message_id)
+            if message_data is not None and packed:
+                message_log[message_id] = edit_packed_message(message_data, record["content"], record["edited_at"])
+            elif message_data is not None:
+                message_data["content"] = record["content"]
+                message_data["edited_at"] = record["edited_at"]
+        elif op == "delete":
+            message_log.pop(message_id, None)
+            if tombstones is not None:
+                tombstones.add(message_id)
+
+    def iter_records(self, channel_id):
+        """Yield every record for the channel in the order it was written"""
+        for path in self.list_segments(channel_id):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # A partially written trailing line from a crash, skip it
+                        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (chatlog.py) Skipping malformed record in {path}")
+
+    def load_channel(self, channel_id, packed=False, tombstones=None):
+        """Rebuild the channel's message log by replaying its segments"""
+        channel_id = str(channel_id)
+        with self.get_channel_lock(channel_id):
+            self.import_legacy_log(channel_id)
+
+            message_log = {}
+            for record in self.iter_records(channel_id):
+                self.apply_record(message_log, record, packed, tombstones)
+            return message_log
+
+    def newest_message_id(self, channel_id, before=None):
+        """Scan the channel's segments for the newest logged message ID below `before`, without building the log"""
+        channel_id = str(channel_id)
+        newest = None
+        with self.get_channel_lock(channel_id):
+            self.import_legacy_log(channel_id)
+            for record in self.iter_records(channel_id):
+                if record.get("op") == "put":
+                    message_id = int(record["id"])
+                    if (before is None or message_id < before) and (newest is None or message_id > newest):
+                        newest = message_id
+        return newest
+
+    def get_archive_file(self, channel_id, month):
+        return os.path.join(self.get_channel_dir(channel_id), f"archive_{month}.ndjson.gz")
+
+    def list_archives(self, channel_id):
+        """Get the channel's compressed monthly archives as a dict of 'YYYY-MM' to path, oldest first"""
+        channel_dir = self.get_channel_dir(channel_id)
+        try:
+            names = sorted(os.listdir(channel_dir))
+        except FileNotFoundError:
+            return {}
+        return {name[len("archive_"):-len(".ndjson.gz")]: os.path.join(channel_dir, name) for name in names if name.startswith("archive_") and name.endswith(".ndjson.gz")}
+
+    def load_archive(self, path):
+        """Load a monthly archive as a dict of message ID to message data"""
+        message_log = {}
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    message_log[record["id"]] = record["data"]
+        except FileNotFoundError:
+            pass
+        return message_log
+
+    def write_archive(self, path, message_log):
+        if not message_log:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+
+        lines = "".join(json.dumps({"op": "put", "id": message_id, "data": message_data}, separators=(',', ':')) + "\n"
+                        for message_id, message_data in sorted(message_log.items(), key=lambda item: int(item[0])))
+        self._atomic_write(path, gzip.compress(lines.encode('utf-8')))
+
+    def get_archived_messages(self, channel_id, message_ids):
+        """Look messages up in the channel's cold archives, loading each month's archive once"""
+        months = {}
+        for message_id in message_ids:
+            months.setdefault(snowflake_time(message_id).strftime('%Y-%m'), []).append(str(message_id))
+
+        found = {}
+        for month, month_ids in months.items():
+            month_log = self.load_archive(self.get_archive_file(channel_id, month))
+            for message_id in month_ids:
+                if message_id in month_log:
+                    found[message_id] = month_log[message_id]
+        return found
+
+    def compact_channel(self, channel_id, hot_after_id, expire_before_id=None):
+        """Move messages with IDs below `hot_after_id` into monthly archives and drop any below `expire_before_id`.
+
+        Edits and deletes logged for messages that were already archived are applied to
+        the archives, as are deletes of messages an edit brought back into the hot log, so
+        the archived copy can't outlive the message. Returns the number of messages archived and expired.
+        """
+        channel_id = str(channel_id)
+        with self.get_channel_lock(channel_id):
+            self.import_legacy_log(channel_id)
+            segments = self.list_segments(channel_id)
+            archive_months = self.list_archives(channel_id)
+
+            hot = {}
+            restored = set()  # IDs brought back from an archive, which still holds their old copy
+            archive_records = []  # edits and deletes that have to reach an archive, in the order they were logged
+            record_count = 0
+            for record in self.iter_records(channel_id):
+                record_count += 1
+                if record.get("op") == "put":
+                    if record.get("restored"):
+                        restored.add(record["id"])
+                elif record.get("id") not in hot or (record.get("op") == "delete" and snowflake_time(record["id"]).strftime('%Y-%m') in archive_months):
+                    archive_records.append(record)
+                self.apply_record(hot, record)
+
+            # Group everything that has to touch an archive by month. The logged edits and
+            # deletes go first, since the puts below carry the newest version of each message
+            cold_months = {}
+            for record in archive_records:
+                month = snowflake_time(record["id"]).strftime('%Y-%m')
+                cold_months.setdefault(month, []).append(record)
+            for message_id in restored:
+                month = snowflake_time(message_id).strftime('%Y-%m')
+                if message_id in hot and int(message_id) >= hot_after_id and month in archive_months:
+                    # Staying in the hot log, so the archived copy is stale
+                    cold_months.setdefault(month, []).append({"op": "delete", "id": message_id})
+            for message_id in [message_id for message_id in hot if int(message_id) < hot_after_id]:
+                month = snowflake_time(message_id).strftime('%Y-%m')
+                cold_months.setdefault(month, []).append({"op": "put", "id": message_id, "data": hot.pop(message_id)})
+
+            expired = 0
+            if expire_before_id is not None:
+                expired_ids = [message_id for message_id in hot if int(message_id) < expire_before_id]
+                for message_id in expired_ids:
+                    del hot[message_id]
+                expired += len(expired_ids)
+
+                # Every month that could still hold expired messages has to be rewritten as well
+                expire_month = snowflake_time(expire_before_id).strftime('%Y-%m')
+                for month in self.list_archives(channel_id):
+                    if month <= expire_month:
+                        cold_months.setdefault(month, [])
+
+            archived = 0
+            for month, records in sorted(cold_months.items()):
+                path = self.get_archive_file(channel_id, month)
+                month_log = self.load_archive(path)
+                before_count = len(month_log)
+                for record in records:
+                    if record["op"] == "put":
+                        archived += 1
+                    self.apply_record(month_log, record)
+
+                if expire_before_id is not None:
+                    expired_ids = [message_id for message_id in month_log if int(message_id) < expire_before_id]
+                    for message_id in expired_ids:
+                        del month_log[message_id]
+                    expired += len(expired_ids)
+
+                if records or len(month_log) != before_count:
+                    self.write_archive(path, month_log)
+
+            # Rewrite the hot segments if anything left them or they are mostly dead records
+            if archived or expired or archive_records or restored or record_count > 2 * len(hot):
+                self.active_segments[channel_id] = self._new_segment_path(channel_id, segments)
+                self._write_records(channel_id, [{"op": "put", "id": message_id, "data": message_data} for message_id, message_data in hot.items()])
+
+                # The new segments are in place, so the old ones can go
+                for path in segments:
+                    os.remove(path)
+
+            return archived, expired
+
+    def import_legacy_log(self, channel_id):
+        """Import a `message_log_<channel>.json` file written by older versions of the bot"""
+        if channel_id in self.checked_legacy_logs:
+            return
+        self.checked_legacy_logs.add(channel_id)
+
+        legacy_file = self.get_legacy_log_file(channel_id)
+        if not os.path.exists(legacy_file):
+            return
+
+        if self.list_segments(channel_id):
+            # Already have segments for this channel, so the legacy file was imported before
+            return
+
+        with open(legacy_file, 'r') as f:
+            message_log = json.load(f)
+
+        self._write_records(channel_id, [{"op": "put", "id": str(message_id), "data": message_data} for message_id, message_data in message_log.items()])
+        os.replace(legacy_file, legacy_file + ".imported")
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (chatlog.py) Imported {len(message_log)} messages from {legacy_file}")
+
+
+class ChatLogCache:
+    """Write-behind cache of channel message logs, shared by the moderation cogs.
+
+    Writes update the in-memory log right away and queue their records as dirty. Dirty
+    records are flushed to the store in batches, either by the periodic flush task or
+    once `flush_threshold` records are waiting, and once more on shutdown. Only the
+    `max_channels` most recently used channel logs are kept in memory, with each message
+    packed into a tuple by pack_message rather than held as the dict it was logged as.
+
+    If a MessageArchive is given, every record is also queued to it so the indexed
+    archive stays in step with the log.
+    """
+    def __init__(self, store, archive=None, max_channels=32, flush_threshold=500):
+        self.store = store
+        self.archive = archive
+        self.max_channels = max_channels
+        self.flush_threshold = flush_threshold
+        self.channels = OrderedDict()  # channel_id -> message log dict, least recently used first
+        self.tombstones = {}  # channel_id -> IDs deleted since the last compaction, which an archive may still hold, for cached channels
+        self.pending = {}  # channel_id -> records not yet written to the store
+        self.flushing = {}  # channel_id -> records currently being written by flush_async
+        self.pending_count = 0
+        self.flush_lock = asyncio.Lock()
+        self.high_water_marks = self.store.load_high_water_marks()  # channel_id -> last message ID with nothing missing before it
+        self.live_ranges = {}  # channel_id -> (first, last) message ID logged live while the channel still needs a backfill
+        self.backfilled_channels = set()
+
+    async def get_log(self, channel_id):
+        """Get the channel's message log, loading it from the store in a worker thread if it isn't cached.
+
+        The load holds the flush lock, so no batch can reach the store between the replay
+        and applying the records still waiting in `pending`.
+        """
+        channel_id = str(channel_id)
+        message_log = self.channels.get(channel_id)
+        if message_log is not None:
+            self.channels.move_to_end(channel_id)
+            return message_log
+
+        async with self.flush_lock:
+            message_log = self.channels.get(channel_id)
+            if message_log is not None:
+                # Loaded by another caller while this one waited for the lock
+                self.channels.move_to_end(channel_id)
+                return message_log
+
+            tombstones = set()
+            message_log = await asyncio.to_thread(self.store.load_channel, channel_id, True, tombstones)
+
+            # Records that haven't reached the store yet still need to show up
+            for record in self.pending.get(channel_id, []):
+                self.store.apply_record(message_log, record, True, tombstones)
+
+        self.channels[channel_id] = message_log
+        self.tombstones[channel_id] = tombstones
+        while len(self.channels) > self.max_channels:
+            # Evicting is safe since dirty records live in self.pending, not in the cached log
+            evicted_id, _ = self.channels.popitem(last=False)
+            self.tombstones.pop(evicted_id, None)
+        return message_log
+
+    async def get_messages(self, channel_id, message_ids):
+        """Get logged messages' data as a dict of message ID to data, falling back to the channel's cold archives.
+
+        Messages deleted since they were archived are left out. Archives are read in a
+        worker thread, each month once however many of the messages it holds.
+        """
+        channel_id = str(channel_id)
+        message_log = await self.get_log(channel_id)
+        tombstones = self.tombstones.get(channel_id, set())
+
+        found = {}
+        missing = []
+        for message_id in map(str, message_ids):
+            packed = message_log.get(message_id)
+            if packed is not None:
+                found[message_id] = unpack_message(message_id, packed)
+            elif message_id not in tombstones:
+                missing.append(message_id)
+
+        if missing:
+            found.update(await asyncio.to_thread(self.store.get_archived_messages, channel_id, missing))
+        return found
+
+    async def get_archived_ids(self, channel_id, month):
+        """Get the IDs held in the channel's cold archive for a 'YYYY-MM' month, read in a worker thread"""
+        path = self.store.get_archive_file(str(channel_id), month)
+        return set(await asyncio.to_thread(self.store.load_archive, path))
+
+    async def get_message(self, channel_id, message_id):
+        """Get a logged message's data, falling back to the channel's cold archives"""
+        return (await self.get_messages(channel_id, [message_id])).get(str(message_id))
+
+    async def get_high_water_mark(self, channel_id):
+        """Get the ID of the newest message logged for the channel with no gap before it, or None if nothing is logged"""
+        channel_id = str(channel_id)
+        if channel_id not in self.high_water_marks:
+            # Logs written before high-water marks were tracked, work it out once from the log itself in a worker thread
+            live_first = self.live_ranges.get(channel_id, (None, None))[0]
+            async with self.flush_lock:
+                newest = await asyncio.to_thread(self.store.newest_message_id, channel_id, live_first)
+                message_ids = [int(record["id"]) for record in self.pending.get(channel_id, []) if record.get("op") == "put"]
+            message_ids = [message_id for message_id in message_ids if live_first is None or message_id < live_first]
+            if newest is not None:
+                message_ids.append(newest)
+            if channel_id in self.high_water_marks or not message_ids:
+                # Set by a backfill while the scan ran, or nothing logged yet
+                return self.high_water_marks.get(channel_id)
+            self.high_water_marks[channel_id] = max(message_ids)
+        return self.high_water_marks[channel_id]
+
+    async def get_backfill_range(self, channel_id, full=False):
+        """Get the (after, before) message IDs a history backfill of the channel has to cover.
+
+        `after` is the high-water mark, or None for a full crawl. `before` is the first
+        message logged live this session, since everything from there on is already logged.
+        """
+        channel_id = str(channel_id)
+        after = None if full else await self.get_high_water_mark(channel_id)
+        before = self.live_ranges.get(channel_id, (None, None))[0]
+        return after, before
+
+    def advance_backfill(self, channel_id, last_message_id):
+        """Move the mark forward as an oldest-first backfill progresses, so a cancelled backfill resumes where it stopped"""
+        channel_id = str(channel_id)
+        if last_message_id > self.high_water_marks.get(channel_id, 0):
+            self.high_water_marks[channel_id] = last_message_id
+
+    def complete_backfill(self, channel_id, last_message_id=None):
+        """Mark the channel as caught up so the high-water mark can follow live messages again"""
+        channel_id = str(channel_id)
+        live_last = self.live_ranges.pop(channel_id, (None, None))[1]
+        candidates = [message_id for message_id in (self.high_water_marks.get(channel_id), last_message_id, live_last) if message_id is not None]
+        if candidates:
+            self.high_water_marks[channel_id] = max(candidates)
+        self.backfilled_channels.add(channel_id)
+
+    def _add_records(self, channel_id, records):
+        channel_id = str(channel_id)
+        message_log = self.channels.get(channel_id)
+        if message_log is not None:
+            tombstones = self.tombstones.get(channel_id)
+            for record in records:
+                self.store.apply_record(message_log, record, True, tombstones)
+        self.pending.setdefault(channel_id, []).extend(records)
+        self.pending_count += len(records)
+
+        if self.archive is not None:
+            self.archive.write_records(channel_id, records)
+
+    def log_message(self, channel_id, message_id, message_data):
+        """Log a message as it is sent"""
+        channel_id = str(channel_id)
+        self._add_records(channel_id, [{"op": "put", "id": str(message_id), "data": message_data}])
+
+        message_id = int(message_id)
+        if channel_id in self.backfilled_channels:
+            self.high_water_marks[channel_id] = max(message_id, self.high_water_marks.get(channel_id, 0))
+        else:
+            # Until a backfill has filled the gap since the last run, the mark can't move past it
+            first, last = self.live_ranges.get(channel_id, (message_id, message_id))
+            self.live_ranges[channel_id] = (min(first, message_id), max(last, message_id))
+
+    def log_messages(self, channel_id, messages):
+        """Log several backfilled messages at once, `messages` being a dict of message ID to message data"""
+        self._add_records(channel_id, [{"op": "put", "id": str(message_id), "data": message_data} for message_id, message_data in messages.items()])
+
+    async def log_edit(self, channel_id, message_id, content, edited_at):
+        if str(message_id) not in await self.get_log(channel_id):
+            archived_data = await self.get_message(channel_id, message_id)
+            if archived_data is not None:
+                # Bring archived messages back into the hot log so the next edit sees this version
+                # Marked as restored so the next compaction drops the archived copy if the message stays hot
+                self._add_records(channel_id, [{"op": "put", "id": str(message_id), "data": dict(archived_data, content=content, edited_at=edited_at), "restored": True}])
+                return
+
+        self._add_records(channel_id, [{"op": "edit", "id": str(message_id), "content": content, "edited_at": edited_at}])
+
+    def log_delete(self, channel_id, message_id, deleted_at=None):
+        self._add_records(channel_id, [{"op": "delete", "id": str(message_id), "deleted_at": deleted_at}])
+
+    def log_deletes(self, channel_id, message_ids, deleted_at=None):
+        """Log several deletes at once, like a purge, so they are written and archived as one batch"""
+        self._add_records(channel_id, [{"op": "delete", "id": str(message_id), "deleted_at": deleted_at} for message_id in message_ids])
+
+    def _write_batches(self, batches, high_water_marks):
+        for channel_id, records in batches.items():
+            self.store.append(channel_id, records)
+
+        # Saved after the records so a mark never points past what is on disk
+        self.store.save_high_water_marks(high_water_marks)
+
+    async def flush_async(self):
+        """Write every dirty record to the store without blocking the event loop"""
+        async with self.flush_lock:
+            if not self.pending:
+                return
+
+            self.flushing, self.pending = self.pending, {}
+            self.pending_count = 0
+            try:
+                await asyncio.to_thread(self._write_batches, self.flushing, dict(self.high_water_marks))
+            except Exception as e:
+                # Put the records back in front of anything logged since so nothing is lost
+                for channel_id, records in self.flushing.items():
+                    self.pending[channel_id] = records + self.pending.get(channel_id, [])
+                    self.pending_count += len(records)
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (chatlog.py) Error flushing chat logs: {e}")
+            finally:
+                self.flushing = {}
+
+    async def compact(self, hot_days, expire_days=None):
+        """Move messages older than `hot_days` into compressed archives and drop any older than `expire_days`.
+
+        Channels are compacted one at a time in a worker thread, each under the flush lock
+        so batched writes can't land mid-rewrite. Returns the number of messages archived and expired.
+        """
+        now = datetime.now(timezone.utc)
+        hot_after_id = time_snowflake(now - timedelta(days=hot_days))
+        expire_before_id = time_snowflake(now - timedelta(days=expire_days)) if expire_days else None
+
+        total_archived = 0
+        total_expired = 0
+        for channel_id in sorted(self.store.channel_ids()):
+            async with self.flush_lock:
+                try:
+                    archived, expired = await asyncio.to_thread(self.store.compact_channel, channel_id, hot_after_id, expire_before_id)
+                except Exception as e:
+                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (chatlog.py) Error compacting chat log for channel {channel_id}: {e}")
+                    continue
+
+                if archived or expired:
+                    # Drop the cached copy so archived messages don't stay in memory
+                    self.channels.pop(channel_id, None)
+                    self.tombstones.pop(channel_id, None)
+                elif channel_id in self.tombstones:
+                    # Deletes already in the segments have been applied to the archives, only unflushed ones still shadow them
+                    pending_deletes = {record["id"] for record in self.pending.get(channel_id, []) if record.get("op") == "delete"}
+                    self.tombstones[channel_id] &= pending_deletes
+                total_archived += archived
+                total_expired += expired
+
+        return total_archived, total_expired
+
+    async def flush_if_needed(self):
+        if self.pending_count >= self.flush_threshold:
+            await self.flush_async()
+
+    def flush(self):
+        """Synchronously write every dirty record to the store, used on shutdown"""
+        batches, self.pending = self.pending, {}
+        self.pending_count = 0
+        self._write_batches(batches, dict(self.high_water_marks))
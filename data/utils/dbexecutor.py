@@ -0,0 +1,121 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+
+class DatabaseExecutor:
+    """Runs every query against one SQLite database on a dedicated thread.
+
+    The thread owns a single long-lived connection in WAL mode. Jobs are callables taking
+    the connection, queued with `submit` or awaited with `run`, so the event loop never
+    waits on the disk or on a lock. Whatever is waiting when the thread wakes up is run in
+    one transaction, each job inside its own savepoint so a failing job only rolls back
+    its own changes and fails its own future.
+
+    The time each job waited in the queue and took to run is kept for `status_text`.
+    """
+    def __init__(self, db_path, name="db-executor", batch_size=100, history=500):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.jobs = queue.Queue()
+
+        self.job_count = 0
+        self.failed_count = 0
+        self.transaction_count = 0
+        self.wait_times = deque(maxlen=history)
+        self.run_times = deque(maxlen=history)
+
+        self.thread = threading.Thread(target=self.worker_loop, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, job):
+        """Queue `job(conn)` to run on the database thread, returning a concurrent Future for its result"""
+        future = Future()
+        self.jobs.put((job, future, time.perf_counter()))
+        return future
+
+    async def run(self, job):
+        """Run `job(conn)` on the database thread and wait for its result without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(job))
+
+    async def execute(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount)
+
+    def worker_loop(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        running = True
+        while running:
+            item = self.jobs.get()
+
+            # Drain whatever else is waiting so bursts are committed in one transaction
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.jobs.get_nowait()
+                except queue.Empty:
+                    break
+            if item is None:
+                running = False
+
+            if batch:
+                self.run_batch(conn, batch)
+
+        conn.close()
+
+    def run_batch(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN")
+            for job, future, queued_at in batch:
+                started = time.perf_counter()
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = (job(conn), None)
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    result = (None, e)
+                finished = time.perf_counter()
+                self.wait_times.append(started - queued_at)
+                self.run_times.append(finished - started)
+                results.append((future, result))
+            conn.execute("COMMIT")
+            self.transaction_count += 1
+        except Exception as e:
+            # The commit itself failed, so nothing in the batch was saved
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (dbexecutor.py) Error committing {len(batch)} jobs to {self.db_path}: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(future, (None, e)) for _, future, _ in batch]
+
+        self.job_count += len(batch)
+        for future, (result, error) in results:
+            if error is not None:
+                self.failed_count += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        """Finish the queued jobs and close the connection"""
+        self.jobs.put(None)
+        self.thread.join()
+
+    def status_text(self):
+        lines = [f"{self.job_count} jobs in {self.transaction_count} transactions, {self.failed_count} failed, {self.jobs.qsize()} waiting."]
+        for label, times in (("Queue wait", self.wait_times), ("Run time", self.run_times)):
+            if times:
+                average = sum(times) / len(times) * 1000
+                lines.append(f"{label}: {average:.2f}ms average, {max(times) * 1000:.2f}ms max over the last {len(times)} jobs")
+        return "\n".join(lines)
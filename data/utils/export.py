@@ -0,0 +1,114 @@
+import argparse
+import csv
+import gzip
+import json
+import sqlite3
+import sys
+from datetime import datetime
+
+EXPORT_FIELDS = ["message_id", "channel_id", "channel_name", "author_id", "author_name", "content", "created_at", "edited_at", "deleted_at", "jump_url"]
+EXPORT_FORMATS = ("ndjson", "csv")
+
+def parse_date_bound(value, end=False):
+    """Turn a 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS' argument into an archive timestamp bound"""
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        date = datetime.strptime(value, "%Y-%m-%d")
+        return date.strftime('%Y-%m-%d 23:59:59' if end else '%Y-%m-%d 00:00:00')
+
+def iter_messages(db_path, channel_ids=None, author_id=None, start=None, end=None, chunk_size=1000):
+    """Yield archived messages matching the filters in message ID order, a chunk of rows at a time.
+
+    Opens its own read-only connection, so it can run in a worker thread or against a
+    copy of the archive while the bot isn't running.
+    """
+    conditions = []
+    params = []
+    if channel_ids:
+        conditions.append(f"channel_id IN ({','.join('?' * len(channel_ids))})")
+        params.extend(int(channel_id) for channel_id in channel_ids)
+    if author_id is not None:
+        conditions.append("author_id = ?")
+        params.append(int(author_id))
+    if start is not None:
+        conditions.append("created_at >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("created_at <= ?")
+        params.append(end)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        # Message ID is the rowid, so this walks the table in order without sorting
+        cursor = conn.execute(f"SELECT {', '.join(EXPORT_FIELDS)} FROM messages {where} ORDER BY message_id", params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                message = dict(row)
+                # Snowflakes are too big for a lot of JSON readers as numbers, so keep them as strings like the chat logs do
+                for field in ("message_id", "channel_id", "author_id"):
+                    message[field] = str(message[field])
+                yield message
+    finally:
+        conn.close()
+
+def write_export(messages, output_path, export_format="ndjson", compress=True):
+    """Write messages to `output_path` as NDJSON or CSV one at a time, returning how many were written"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format}, expected one of {', '.join(EXPORT_FORMATS)}")
+
+    if compress:
+        output = gzip.open(output_path, 'wt', encoding='utf-8', newline='')
+    else:
+        output = open(output_path, 'w', encoding='utf-8', newline='')
+
+    count = 0
+    with output:
+        if export_format == "csv":
+            writer = csv.DictWriter(output, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for message in messages:
+                writer.writerow(message)
+                count += 1
+        else:
+            for message in messages:
+                output.write(json.dumps(message, ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+def export_messages(db_path, output_path, export_format="ndjson", compress=True, **filters):
+    """Stream every archived message matching `filters` (see iter_messages) into an export file"""
+    return write_export(iter_messages(db_path, **filters), output_path, export_format, compress)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export logged chat messages from the message archive.")
+    parser.add_argument("database", help="Path to message_archive.db, normally chat_logs/message_archive.db")
+    parser.add_argument("output", help="File to write the export to")
+    parser.add_argument("--channel", action="append", dest="channels", help="Only export this channel ID, can be given more than once")
+    parser.add_argument("--user", help="Only export messages from this user ID")
+    parser.add_argument("--after", help="Only export messages from this date on, 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument("--before", help="Only export messages up to this date, 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--no-gzip", action="store_true", help="Write the export uncompressed")
+    args = parser.parse_args(argv)
+
+    try:
+        start = parse_date_bound(args.after)
+        end = parse_date_bound(args.before, end=True)
+    except ValueError:
+        parser.error("Invalid date format. Please use 'YYYY-MM-DD'.")
+
+    count = export_messages(args.database, args.output, args.format, not args.no_gzip,
+                            channel_ids=args.channels, author_id=args.user, start=start, end=end)
+    print(f"Exported {count} messages to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,161 @@
+import asyncio
+import time
+from collections import Counter, deque
+from datetime import datetime
+import discord
+
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_FILES_PER_MESSAGE = 10
+
+class LogEntry:
+    __slots__ = ("embed", "file", "queued_at")
+
+    def __init__(self, embed, file=None):
+        self.embed = embed
+        self.file = file
+        self.queued_at = time.monotonic()
+
+class LogSender:
+    """Outbound queue of log embeds, one per destination channel.
+
+    Entries are packed up to 10 embeds per message and sent when a message is full or
+    the oldest entry has waited `flush_interval` seconds. If a channel falls more than
+    `max_queue` entries behind, the oldest entries are dropped and replaced with a
+    single summary embed counting what was dropped.
+    """
+    def __init__(self, bot, flush_interval=2.0, max_queue=250):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+
+        self.queues = {}  # channel ID -> deque of LogEntry
+        self.ready = {}  # channel ID -> asyncio.Event, set when there's something to look at
+        self.workers = {}  # channel ID -> asyncio.Task
+        self.dropped = {}  # channel ID -> Counter of dropped embed titles
+
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.dropped_embeds = 0
+        self.latencies = deque(maxlen=200)  # seconds from queued to sent, most recent entries
+
+    def send(self, channel_id, embed, file=None):
+        """Queue an embed (and optional file) for a log channel. Returns immediately."""
+        channel_id = int(channel_id)
+        queue = self.queues.get(channel_id)
+        if queue is None:
+            queue = self.queues[channel_id] = deque()
+            self.ready[channel_id] = asyncio.Event()
+            self.dropped[channel_id] = Counter()
+
+        queue.append(LogEntry(embed, file))
+        if len(queue) > self.max_queue:
+            # Far behind, keep the newest entries and summarize the rest
+            dropped = queue.popleft()
+            self.dropped[channel_id][dropped.embed.title or "Untitled"] += 1
+            self.dropped_embeds += 1
+
+        if len(queue) == 1 or len(queue) >= MAX_EMBEDS_PER_MESSAGE:
+            self.ready[channel_id].set()
+
+        worker = self.workers.get(channel_id)
+        if worker is None or worker.done():
+            self.workers[channel_id] = asyncio.create_task(self.run_channel(channel_id))
+
+    async def run_channel(self, channel_id):
+        queue = self.queues[channel_id]
+        ready = self.ready[channel_id]
+        while True:
+            await ready.wait()
+            ready.clear()
+
+            # Give a part-full message until the oldest entry is due to fill up
+            if queue and len(queue) < MAX_EMBEDS_PER_MESSAGE:
+                remaining = self.flush_interval - (time.monotonic() - queue[0].queued_at)
+                if remaining > 0:
+                    try:
+                        await asyncio.wait_for(ready.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    ready.clear()
+
+            while queue and (len(queue) >= MAX_EMBEDS_PER_MESSAGE or time.monotonic() - queue[0].queued_at >= self.flush_interval):
+                await self.send_batch(channel_id, self.take_batch(channel_id))
+
+            if queue:
+                ready.set()
+
+    def take_batch(self, channel_id):
+        queue = self.queues[channel_id]
+        batch = []
+
+        dropped = self.dropped[channel_id]
+        if dropped:
+            batch.append(LogEntry(self.dropped_summary(dropped)))
+            self.dropped[channel_id] = Counter()
+
+        embed_chars = sum(len(entry.embed) for entry in batch)
+        files = 0
+        while queue and len(batch) < MAX_EMBEDS_PER_MESSAGE:
+            entry = queue[0]
+            entry_files = 1 if entry.file else 0
+            if batch and (embed_chars + len(entry.embed) > MAX_EMBED_CHARS_PER_MESSAGE or files + entry_files > MAX_FILES_PER_MESSAGE):
+                break
+            queue.popleft()
+            batch.append(entry)
+            embed_chars += len(entry.embed)
+            files += entry_files
+        return batch
+
+    def dropped_summary(self, dropped):
+        total = sum(dropped.values())
+        embed = discord.Embed(
+            title="Log Entries Dropped",
+            description=f"The logs fell too far behind, so {total} entries were dropped.",
+            color=discord.Color.orange(),
+            timestamp=datetime.now().astimezone()
+        )
+        for title, count in dropped.most_common(25):
+            embed.add_field(name=title, value=str(count), inline=True)
+        return embed
+
+    async def send_batch(self, channel_id, batch):
+        channel = self.bot.get_channel(channel_id)
+        if not channel:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (logsender.py) Logs channel with ID {channel_id} not found, dropping {len(batch)} log entries.")
+            return
+
+        files = [entry.file for entry in batch if entry.file]
+        try:
+            await channel.send(embeds=[entry.embed for entry in batch], files=files or discord.utils.MISSING)
+        except discord.HTTPException as e:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (logsender.py) Error sending {len(batch)} log entries to channel {channel_id}: {e}")
+            return
+
+        sent_at = time.monotonic()
+        self.sent_messages += 1
+        self.sent_embeds += len(batch)
+        self.latencies.extend(sent_at - entry.queued_at for entry in batch)
+
+    async def flush(self):
+        """Send everything that's queued now, without waiting for the timer"""
+        for channel_id, queue in self.queues.items():
+            while queue or self.dropped[channel_id]:
+                await self.send_batch(channel_id, self.take_batch(channel_id))
+
+    def queue_depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def status_text(self):
+        now = time.monotonic()
+        if self.latencies:
+            average = sum(self.latencies) / len(self.latencies)
+            latency = f"{average:.1f}s average, {max(self.latencies):.1f}s max over the last {len(self.latencies)} entries"
+        else:
+            latency = "no entries sent yet"
+
+        lines = [f"{self.sent_embeds} log entries sent in {self.sent_messages} messages, {self.dropped_embeds} dropped. Latency: {latency}."]
+        for channel_id, queue in self.queues.items():
+            oldest = f", oldest waiting {now - queue[0].queued_at:.1f}s" if queue else ""
+            lines.append(f"<#{channel_id}>: {len(queue)} queued{oldest}")
+        return "\n".join(lines)
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import time
+from datetime import datetime
+from utils.dbexecutor import DatabaseExecutor
+
+class QueueEngine:
+    """In-memory game queue shared by the queue cogs, written through to SQLite.
+
+    `entries` maps user ID to (join sequence, username, is_subscriber) in join order, and
+    `subscribers` is the same order restricted to subscribers, so counts and the top of
+    either queue are O(1) reads. Every join gets the next join sequence, saved with the
+    row, and `ranks` counts the sequences still in the queue so a position is an exact
+    O(log n) prefix sum, even for joins in the same second.
+
+    The database is only read once, when the engine is created. Every change is applied
+    in memory straight away, so concurrent button presses always see the latest queue,
+    then written through the database thread before the mutating call returns.
+
+    Every change, including disabling or enabling the queue, is published to the
+    listeners added with `add_listener` as an event name ("join", "leave", "clear" or
+    "disabled"), so the queue messages only re-render when something actually changed.
+    """
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.db_path = os.path.join(self.data_dir, "queue_system.db")
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        self.entries = {}  # user ID -> (join sequence, username, is_subscriber), in join order
+        self.subscribers = {}  # user ID -> None, subscribers in join order
+        self.next_sequence = 1
+        self.base_sequence = 1  # join sequence counted at index 0 of `ranks`
+        self.ranks = FenwickTree(1024)
+        self.listeners = []
+        self.disable_file = os.path.join(self.data_dir, "disablequeue")
+        self.disabled = os.path.exists(self.disable_file)
+
+        self.db = DatabaseExecutor(self.db_path, name="queue-db")
+        # Runs before the event loop starts, so waiting on the database thread here is fine
+        self.db.submit(self.init_database).result()
+        self.load(self.db.submit(self.read_queue).result())
+
+    def init_database(self, conn):
+        """Initialize the SQLite database"""
+        conn.execute('''CREATE TABLE IF NOT EXISTS queue_users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            is_subscriber BOOLEAN,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            join_seq INTEGER
+        )''')
+
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(queue_users)")]
+        if "join_seq" not in columns:
+            # Queue saved before join sequences, number it in join order. The rowid is the user ID, so same-second
+            # joins can't be told apart any more and just keep a stable order
+            conn.execute("ALTER TABLE queue_users ADD COLUMN join_seq INTEGER")
+            rows = conn.execute("SELECT user_id FROM queue_users ORDER BY joined_at ASC, user_id ASC").fetchall()
+            conn.executemany("UPDATE queue_users SET join_seq=? WHERE user_id=?", [(sequence, user_id) for sequence, (user_id,) in enumerate(rows, 1)])
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_users_join_seq ON queue_users (join_seq)")
+
+    def read_queue(self, conn):
+        return conn.execute("SELECT user_id, username, is_subscriber, join_seq FROM queue_users ORDER BY join_seq ASC").fetchall()
+
+    def load(self, rows):
+        for user_id, username, is_subscriber, sequence in rows:
+            self.add_entry(user_id, username, bool(is_subscriber), sequence)
+
+    def add_entry(self, user_id, username, is_subscriber, sequence=None):
+        if sequence is None:
+            sequence = self.next_sequence
+        self.next_sequence = max(self.next_sequence, sequence + 1)
+        if sequence - self.base_sequence >= self.ranks.size:
+            self.rebuild_ranks(sequence)
+
+        self.entries[user_id] = (sequence, username, is_subscriber)
+        if is_subscriber:
+            self.subscribers[user_id] = None
+        self.ranks.add(sequence - self.base_sequence, 1)
+        return sequence
+
+    def remove_entry(self, user_id):
+        sequence, username, is_subscriber = self.entries.pop(user_id)
+        self.subscribers.pop(user_id, None)
+        self.ranks.add(sequence - self.base_sequence, -1)
+        return username
+
+    def rebuild_ranks(self, sequence):
+        """Start `ranks` over at the oldest sequence still queued, with room for `sequence` and as many joins again"""
+        sequences = [entry[0] for entry in self.entries.values()]
+        self.base_sequence = sequences[0] if sequences else sequence
+        size = max(1024, 2 * (sequence - self.base_sequence + 1))
+        self.ranks = FenwickTree.build(size, [other - self.base_sequence for other in sequences])
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, event):
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (queueengine.py) Error in queue listener: {e}")
+
+    def set_disabled(self, disabled):
+        """Disable or enable joining the queue, kept as the disablequeue file so it survives a restart"""
+        if disabled == self.disabled:
+            return
+        if disabled:
+            with open(self.disable_file, 'w') as f:
+                f.write("Queue disabled")
+        elif os.path.exists(self.disable_file):
+            os.remove(self.disable_file)
+        self.disabled = disabled
+        self.notify("disabled")
+
+    def count(self):
+        return len(self.entries)
+
+    def __contains__(self, user_id):
+        return user_id in self.entries
+
+    def position(self, user_id):
+        """Get the user's 1-based place in the queue, or 0 if they aren't in it"""
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return 0
+        return self.ranks.prefix_sum(entry[0] - self.base_sequence)
+
+    def users(self):
+        """Get (user_id, username, is_subscriber) for everyone in the queue, in join order"""
+        return [(user_id, username, is_subscriber) for user_id, (_, username, is_subscriber) in self.entries.items()]
+
+    def top(self, subscriber=False):
+        """Get (user_id, username) for the first user, or first subscriber, in the queue"""
+        user_ids = self.subscribers if subscriber else self.entries
+        user_id = next(iter(user_ids), None)
+        if user_id is None:
+            return None, None
+        return user_id, self.entries[user_id][1]
+
+    async def join(self, user_id, username, is_subscriber):
+        """Add a user to the end of the queue, returning False if they're already in it"""
+        if user_id in self.entries:
+            return False
+        sequence = self.add_entry(user_id, username, bool(is_subscriber))
+        self.notify("join")
+        try:
+            await self.db.execute("INSERT INTO queue_users (user_id, username, is_subscriber, join_seq) VALUES (?, ?, ?, ?)", (user_id, username, is_subscriber, sequence))
+        except Exception:
+            # Not saved, so take them back out and let them try again
+            if user_id in self.entries:
+                self.remove_entry(user_id)
+                self.notify("leave")
+            raise
+        return True
+
+    async def remove(self, user_id):
+        """Remove a user from the queue, returning their username or None if they weren't in it"""
+        if user_id not in self.entries:
+            return None
+        username = self.remove_entry(user_id)
+        self.notify("leave")
+        await self.db.execute("DELETE FROM queue_users WHERE user_id=?", (user_id,))
+        return username
+
+    async def pull_top(self, subscriber=False):
+        """Remove and return (user_id, username) for the top of the queue or subscriber queue"""
+        user_id, username = self.top(subscriber)
+        if user_id is not None:
+            await self.remove(user_id)
+        return user_id, username
+
+    async def clear(self):
+        """Empty the queue, returning the users that were in it"""
+        users = self.users()
+        self.entries.clear()
+        self.subscribers.clear()
+        self.ranks = FenwickTree(1024)
+        self.base_sequence = self.next_sequence
+        self.notify("clear")
+        await self.db.execute("DELETE FROM queue_users")
+        return users
+
+    def close(self):
+        self.db.close()
+
+class FenwickTree:
+    """Binary indexed tree of counts at indexes 0 to size - 1.
+
+    Adding to a count and summing every count up to an index are both O(log n).
+    """
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    @classmethod
+    def build(cls, size, indexes):
+        """Make a tree with a count of 1 at each of `indexes` in O(size)"""
+        tree = cls(size)
+        for index in indexes:
+            tree.tree[index + 1] += 1
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree.tree[parent] += tree.tree[i]
+        return tree
+
+    def add(self, index, delta):
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, index):
+        """Sum of the counts at indexes 0 through `index`"""
+        total = 0
+        i = min(index + 1, self.size)
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+class CoalescedRefresh:
+    """Re-renders a message after queue events without editing it once per event.
+
+    `request` only marks the message stale. The first request starts a task that waits
+    `delay` seconds for the rest of a burst to arrive, then awaits `render` once for
+    everything that happened. Requests during a render are picked up by one more render
+    no sooner than `min_interval` seconds later, so a rush of joins turns into a few
+    edits that stay under Discord's edit rate limit.
+    """
+    def __init__(self, render, delay=0.5, min_interval=2.0):
+        self.render = render
+        self.delay = delay
+        self.min_interval = min_interval
+        self.stale = False
+        self.last_render = 0.0
+        self.task = None
+        self.render_count = 0
+
+    def request(self, event=None):
+        self.stale = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while self.stale:
+            await asyncio.sleep(max(self.delay, self.last_render + self.min_interval - time.monotonic()))
+            self.stale = False
+            self.last_render = time.monotonic()
+            self.render_count += 1
+            try:
+                await self.render()
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (queueengine.py) Error refreshing queue message: {e}")
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
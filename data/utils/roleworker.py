@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime
+import discord
+
+class RoleWorker:
+    """Gives a role to members who are missing it, a few at a time.
+
+    Members are tracked by ID in `missing`, the index of members still needing the role,
+    and handed to `concurrency` worker tasks. discord.py already waits out 429s, so the
+    workers only bound how many requests are in flight and retry server errors with a
+    backoff. `on_assigned(member, role, reason)` is awaited after each assignment.
+    """
+    def __init__(self, bot, role_id, on_assigned=None, concurrency=2, max_attempts=4, retry_delay=5):
+        self.bot = bot
+        self.role_id = int(role_id)
+        self.on_assigned = on_assigned
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+        self.missing = {}  # member ID -> (guild ID, reason), in the order they were found
+        self.queue = asyncio.Queue()
+        self.resumed = asyncio.Event()  # cleared while paused, members are still tracked but not given the role
+        self.resumed.set()
+        self.workers = []
+        self.assigned_count = 0
+        self.failed_count = 0
+
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self.run()) for _ in range(self.concurrency)]
+
+    def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
+
+    def pause(self):
+        self.resumed.clear()
+
+    def resume(self):
+        self.resumed.set()
+
+    @property
+    def paused(self):
+        return not self.resumed.is_set()
+
+    def has_role(self, member):
+        return member.get_role(self.role_id) is not None
+
+    def track(self, member, reason):
+        """Queue the member for the role if they don't have it yet"""
+        if member.bot or self.has_role(member):
+            self.discard(member.id)
+            return
+        if member.id not in self.missing:
+            self.missing[member.id] = (member.guild.id, reason)
+            self.queue.put_nowait(member.id)
+
+    def discard(self, member_id):
+        """Stop tracking a member, like when they leave or got the role some other way"""
+        self.missing.pop(member_id, None)
+
+    async def run(self):
+        while True:
+            member_id = await self.queue.get()
+            # Checked after dequeuing, since a worker already waiting on the queue wouldn't see a pause otherwise
+            await self.resumed.wait()
+            try:
+                await self.assign(member_id)
+            except Exception as e:
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (roleworker.py) Error adding role to member {member_id}: {e}")
+            finally:
+                self.missing.pop(member_id, None)
+                self.queue.task_done()
+
+    async def assign(self, member_id):
+        if member_id not in self.missing:
+            return  # Left or got the role while queued
+        guild_id, reason = self.missing[member_id]
+
+        guild = self.bot.get_guild(guild_id)
+        member = guild.get_member(member_id) if guild else None
+        if member is None or self.has_role(member):
+            return
+
+        role = guild.get_role(self.role_id)
+        if not role:
+            print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (roleworker.py) Role with ID {self.role_id} not found in guild {guild.name}")
+            return
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await member.add_roles(role)
+                break
+            except discord.Forbidden:
+                self.failed_count += 1
+                print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (roleworker.py) Missing permissions to add role to {member.name}")
+                return
+            except discord.NotFound:
+                return  # Left in the meantime
+            except (discord.HTTPException, asyncio.TimeoutError) as e:
+                if attempt == self.max_attempts:
+                    self.failed_count += 1
+                    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (roleworker.py) Giving up adding role to {member.name} after {attempt} attempts: {e}")
+                    return
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+        self.assigned_count += 1
+        print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] (roleworker.py) Added {role.name} to {member.name}.")
+        if self.on_assigned:
+            await self.on_assigned(member, role, reason)
@@ -0,0 +1,86 @@
+import re
+from collections import deque
+
+FINGERPRINT_BITS = 64
+FINGERPRINT_MASK = (1 << FINGERPRINT_BITS) - 1
+SHINGLE_SIZE = 5
+
+URL_PATTERN = re.compile(r"https?://([^/\s]+)\S*")
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]|_")
+
+def normalize(text):
+    """Reduce text to lowercase words, with links cut down to their host, so trivial variations fingerprint the same"""
+    text = URL_PATTERN.sub(r" \1 ", text.lower())
+    text = PUNCTUATION_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+def simhash(text):
+    """Get a 64-bit similarity hash of the text's character 5-grams.
+
+    Texts that differ by a few characters get fingerprints that differ in only a few bits.
+    Uses the built-in string hash, so fingerprints are only comparable within one run of
+    the bot. Returns None for text too short to fingerprint.
+    """
+    text = normalize(text)
+    if len(text) < SHINGLE_SIZE:
+        return None
+
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+    rows = [format(hash(shingle) & FINGERPRINT_MASK, '064b') for shingle in shingles]
+
+    # Each bit is set if most shingles have it set, counted a column at a time
+    half = len(rows) / 2
+    fingerprint = 0
+    for column in zip(*rows):
+        fingerprint = (fingerprint << 1) | (column.count('1') > half)
+    return fingerprint
+
+class SimhashIndex:
+    """Time-bounded index of fingerprints for near-duplicate lookups.
+
+    Fingerprints within `max_distance` bits of each other must share at least one of
+    `max_distance + 1` equal-width blocks exactly (any leftover bits don't matter), so each block value maps to a bucket
+    of entries and a lookup only compares the few candidates in matching buckets.
+    Entries older than `window_seconds` are evicted from the front of each bucket,
+    since buckets fill in time order.
+    """
+    def __init__(self, max_distance=8, window_seconds=600):
+        self.max_distance = max_distance
+        self.window_seconds = window_seconds
+        self.block_count = max_distance + 1
+        self.block_bits = FINGERPRINT_BITS // self.block_count
+        self.block_mask = (1 << self.block_bits) - 1
+
+        self.entries = deque()  # (time, fingerprint, item), oldest first
+        self.buckets = {}  # (block index, block value) -> deque of entries
+
+    def blocks(self, fingerprint):
+        for index in range(self.block_count):
+            yield index, (fingerprint >> (index * self.block_bits)) & self.block_mask
+
+    def expire(self, now):
+        cutoff = now - self.window_seconds
+        while self.entries and self.entries[0][0] < cutoff:
+            entry = self.entries.popleft()
+            for key in self.blocks(entry[1]):
+                bucket = self.buckets[key]
+                bucket.popleft()
+                if not bucket:
+                    del self.buckets[key]
+
+    def add(self, now, fingerprint, item):
+        self.expire(now)
+        entry = (now, fingerprint, item)
+        self.entries.append(entry)
+        for key in self.blocks(fingerprint):
+            self.buckets.setdefault(key, deque()).append(entry)
+
+    def find(self, now, fingerprint):
+        """Get the items of every indexed fingerprint within `max_distance` bits, oldest first"""
+        self.expire(now)
+        matches = {}
+        for key in self.blocks(fingerprint):
+            for entry in self.buckets.get(key, ()):
+                if id(entry) not in matches and (entry[1] ^ fingerprint).bit_count() <= self.max_distance:
+                    matches[id(entry)] = entry
+        return [entry[2] for entry in sorted(matches.values(), key=lambda entry: entry[0])]
@@ -0,0 +1,153 @@
+import re
+from collections import Counter, deque
+from datetime import timedelta
+
+CUSTOM_EMOJI_PATTERN = re.compile(r"<a?:\w+:\d+>")
+
+def content_hash(content):
+    """Hash message content so small differences in case and spacing still count as a repeat"""
+    return hash(" ".join(content.lower().split()))
+
+class FloodDetector:
+    """Sliding-window message rate and repeat tracking for the on_message path.
+
+    Each user and channel keeps a deque of recent message times, trimmed from the front
+    as the window moves, so checking a message is amortized O(1) and touches nothing but
+    memory. Repeats are tracked by hashed content per user with a running count per hash.
+
+    `check` returns a list of (kind, count) tuples for every threshold the message went
+    over, `kind` being "user", "duplicate" or "channel". Messages shorter than
+    `duplicate_min_length` characters, not counting custom emoji, are left out of the
+    repeat tracking, since chat repeats things like "gg" or an emote all the time.
+    """
+    def __init__(self, user_messages=6, user_seconds=8, duplicate_messages=3, duplicate_seconds=60, channel_messages=40, channel_seconds=10, duplicate_min_length=10):
+        self.user_messages = user_messages
+        self.user_seconds = user_seconds
+        self.duplicate_messages = duplicate_messages
+        self.duplicate_seconds = duplicate_seconds
+        self.duplicate_min_length = duplicate_min_length
+        self.channel_messages = channel_messages
+        self.channel_seconds = channel_seconds
+
+        self.user_times = {}  # user ID -> deque of message times
+        self.user_hashes = {}  # user ID -> deque of (time, content hash)
+        self.user_hash_counts = {}  # user ID -> Counter of content hashes still in the window
+        self.channel_times = {}  # channel ID -> deque of message times
+
+    @staticmethod
+    def _trim(times, cutoff):
+        while times and times[0] < cutoff:
+            times.popleft()
+
+    def check(self, now, user_id, channel_id, content):
+        exceeded = []
+
+        times = self.user_times.setdefault(user_id, deque())
+        times.append(now)
+        self._trim(times, now - self.user_seconds)
+        if len(times) > self.user_messages:
+            exceeded.append(("user", len(times)))
+
+        if content and len(CUSTOM_EMOJI_PATTERN.sub("", content).strip()) >= self.duplicate_min_length:
+            hashes = self.user_hashes.setdefault(user_id, deque())
+            counts = self.user_hash_counts.setdefault(user_id, Counter())
+            cutoff = now - self.duplicate_seconds
+            while hashes and hashes[0][0] < cutoff:
+                expired = hashes.popleft()[1]
+                counts[expired] -= 1
+                if not counts[expired]:
+                    del counts[expired]
+
+            digest = content_hash(content)
+            hashes.append((now, digest))
+            counts[digest] += 1
+            if counts[digest] > self.duplicate_messages:
+                exceeded.append(("duplicate", counts[digest]))
+
+        times = self.channel_times.setdefault(channel_id, deque())
+        times.append(now)
+        self._trim(times, now - self.channel_seconds)
+        if len(times) > self.channel_messages:
+            exceeded.append(("channel", len(times)))
+
+        return exceeded
+
+    def reset_user(self, user_id):
+        """Forget a user's history, like after they've been timed out, so the next message starts fresh"""
+        self.user_times.pop(user_id, None)
+        self.user_hashes.pop(user_id, None)
+        self.user_hash_counts.pop(user_id, None)
+
+    def reset_channel(self, channel_id):
+        self.channel_times.pop(channel_id, None)
+
+    def prune(self, now):
+        """Drop users and channels with nothing left in their windows, run every so often off the message path"""
+        for user_id in [user_id for user_id, times in self.user_times.items() if not times or times[-1] < now - self.user_seconds]:
+            del self.user_times[user_id]
+        for user_id in [user_id for user_id, hashes in self.user_hashes.items() if not hashes or hashes[-1][0] < now - self.duplicate_seconds]:
+            del self.user_hashes[user_id]
+            del self.user_hash_counts[user_id]
+        for channel_id in [channel_id for channel_id, times in self.channel_times.items() if not times or times[-1] < now - self.channel_seconds]:
+            del self.channel_times[channel_id]
+
+ACCOUNT_AGE_BUCKETS = [
+    ("< 1 hour", timedelta(hours=1)),
+    ("< 1 day", timedelta(days=1)),
+    ("< 1 week", timedelta(weeks=1)),
+    ("< 1 month", timedelta(days=30)),
+    ("< 1 year", timedelta(days=365)),
+    ("Older", timedelta.max)
+]
+
+def account_age_histogram(created_times, now):
+    """Count accounts into ACCOUNT_AGE_BUCKETS by how long ago they were created"""
+    counts = Counter()
+    for created_at in created_times:
+        age = now - created_at
+        counts[next(label for label, limit in ACCOUNT_AGE_BUCKETS if age < limit)] += 1
+    return [(label, counts[label]) for label, _ in ACCOUNT_AGE_BUCKETS]
+
+def name_pattern(name):
+    """Reduce a username to its shape, so names like raider123 and raider987 group together"""
+    return re.sub(r"\d+", "#", name.lower()).strip("._")
+
+class RaidTracker:
+    """Sliding-window join rate tracking for raid detection.
+
+    A raid starts once `join_count` members join within `join_seconds`, and is over
+    once the rate has stayed under that for `cooldown_seconds`. Joins and leaves during
+    a raid are gathered in `pending_joins` and `pending_leaves` for the next summary.
+    """
+    def __init__(self, join_count=10, join_seconds=60, cooldown_seconds=120):
+        self.join_count = join_count
+        self.join_seconds = join_seconds
+        self.cooldown_seconds = cooldown_seconds
+
+        self.join_times = deque()
+        self.last_over = None  # last time the join rate was at or over the threshold
+        self.active = False
+        self.pending_joins = []
+        self.pending_leaves = 0
+
+    def add_join(self, now):
+        """Record a join and return True if it starts a raid"""
+        self.join_times.append(now)
+        while self.join_times[0] < now - self.join_seconds:
+            self.join_times.popleft()
+
+        if len(self.join_times) >= self.join_count:
+            self.last_over = now
+            if not self.active:
+                self.active = True
+                return True
+        return False
+
+    def is_over(self, now):
+        return self.active and now - self.last_over >= self.cooldown_seconds
+
+    def take_pending(self):
+        joins, leaves = self.pending_joins, self.pending_leaves
+        self.pending_joins = []
+        self.pending_leaves = 0
+        return joins, leaves
@@ -0,0 +1,153 @@
+import difflib
+import json
+import re
+
+TOKEN_PATTERN = re.compile(r'\w+\s*|[^\w\s]\s*|\s+')
+
+ANSI_DELETED = "\x1b[2;41m"
+ANSI_INSERTED = "\x1b[2;42m"
+ANSI_RESET = "\x1b[0m"
+
+def tokenize(text):
+    """Split text into word, whitespace and punctuation tokens that join back into the original text"""
+    return TOKEN_PATTERN.findall(text)
+
+def diff_opcodes(a, b, max_work=1_000_000):
+    """Get SequenceMatcher-style opcodes turning token list `a` into `b` with bounded work.
+
+    The common prefix and suffix are matched directly. If what's left in the middle is
+    still bigger than `max_work` (length of one side times the other), it is reported
+    as a single replace instead of being diffed.
+    """
+    prefix = 0
+    max_prefix = min(len(a), len(b))
+    while prefix < max_prefix and a[prefix] == b[prefix]:
+        prefix += 1
+
+    suffix = 0
+    max_suffix = max_prefix - prefix
+    while suffix < max_suffix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+
+    a_end = len(a) - suffix
+    b_end = len(b) - suffix
+
+    opcodes = []
+    if prefix:
+        opcodes.append(('equal', 0, prefix, 0, prefix))
+
+    if prefix < a_end or prefix < b_end:
+        if (a_end - prefix) * (b_end - prefix) > max_work:
+            opcodes.append(('replace', prefix, a_end, prefix, b_end))
+        elif prefix == a_end:
+            opcodes.append(('insert', prefix, a_end, prefix, b_end))
+        elif prefix == b_end:
+            opcodes.append(('delete', prefix, a_end, prefix, b_end))
+        else:
+            matcher = difflib.SequenceMatcher(None, a[prefix:a_end], b[prefix:b_end])
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+
+    if suffix:
+        opcodes.append(('equal', a_end, len(a), b_end, len(b)))
+    return opcodes
+
+def make_delta(new_text, old_text):
+    """Build a compact delta that turns `new_text` back into `old_text`.
+
+    The delta is a JSON list of [start, end, replacement] entries over the tokens of
+    `new_text`, so its size follows the size of the change rather than the message.
+    """
+    new_tokens = tokenize(new_text)
+    old_tokens = tokenize(old_text)
+
+    delta = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(new_tokens, old_tokens):
+        if tag != 'equal':
+            delta.append([i1, i2, "".join(old_tokens[j1:j2])])
+    return json.dumps(delta, separators=(',', ':'), ensure_ascii=False)
+
+def apply_delta(tokens, delta):
+    """Apply a delta from make_delta to the tokens of the newer text in place, leaving the tokens of the older text.
+
+    Only the replacements are tokenized, so walking back through several revisions never
+    re-tokenizes or re-joins the whole message.
+    """
+    # Splice from the end so the earlier token indexes stay valid
+    for start, end, replacement in reversed(json.loads(delta)):
+        tokens[start:end] = tokenize(replacement)
+
+def collapse_context(text, context, at_start, at_end):
+    """Shorten an unchanged run of text to `context` characters next to each change"""
+    if len(text) <= 2 * context + 5:
+        return text
+    if at_start and at_end:
+        return text
+    if at_start:
+        return "…" + text[-context:]
+    if at_end:
+        return text[:context] + "…"
+    return text[:context] + " … " + text[-context:]
+
+def diff_segments(old_text, new_text, context=40):
+    """Diff two messages by word.
+
+    Returns (before, after) lists of (changed, text) segments. Unchanged runs are
+    collapsed to `context` characters either side of a change.
+    """
+    old_tokens = tokenize(old_text)
+    new_tokens = tokenize(new_text)
+    opcodes = diff_opcodes(old_tokens, new_tokens)
+
+    before = []
+    after = []
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == 'equal':
+            text = collapse_context("".join(old_tokens[i1:i2]), context, index == 0, index == len(opcodes) - 1)
+            before.append((False, text))
+            after.append((False, text))
+            continue
+
+        if i2 > i1:
+            before.append((True, "".join(old_tokens[i1:i2])))
+        if j2 > j1:
+            after.append((True, "".join(new_tokens[j1:j2])))
+    return before, after
+
+def format_ansi_fields(segments, highlight, limit=1024):
+    """Render diff segments as ```ansi code blocks, split into as many pieces as needed to fit `limit` characters each"""
+    # Keep a code fence from ending the block early
+    segments = [(changed, text.replace("```", "`\u200b``")) for changed, text in segments]
+
+    body_limit = limit - len("```ansi\n```")
+    piece_limit = body_limit - len(highlight) - len(ANSI_RESET)
+
+    blocks = []
+    current = ""
+    for changed, text in segments:
+        for start in range(0, len(text), piece_limit):
+            piece = text[start:start + piece_limit]
+            rendered = f"{highlight}{piece}{ANSI_RESET}" if changed else piece
+            if current and len(current) + len(rendered) > body_limit:
+                blocks.append(current)
+                current = ""
+            current += rendered
+
+    blocks.append(current.rstrip())
+    return [f"```ansi\n{block}```" for block in blocks]
+
+def render_word_diff(old_text, new_text):
+    """Render a full plain text word diff, marking removed words [-like this-] and added words {+like this+}"""
+    old_tokens = tokenize(old_text)
+    new_tokens = tokenize(new_text)
+
+    parts = []
+    for tag, i1, i2, j1, j2 in diff_opcodes(old_tokens, new_tokens):
+        if tag == 'equal':
+            parts.append("".join(old_tokens[i1:i2]))
+            continue
+        if i2 > i1:
+            parts.append("[-" + "".join(old_tokens[i1:i2]) + "-]")
+        if j2 > j1:
+            parts.append("{+" + "".join(new_tokens[j1:j2]) + "+}")
+    return "".join(parts)